@@ -0,0 +1,98 @@
+"""
+Recording Buffer
+================
+
+This module defines the RecordingBuffer class, which collects raw PCM data of
+a recording within a fixed memory budget. The data are kept in a preallocated
+bytearray and, whenever it gets full, spilled to a temporary WAV file, so even
+hour-long recordings are captured in constant memory.
+
+Example usage:
+    buffer = RecordingBuffer(RECORDINGS_DIR, frame_rate=44100, channels=1)
+    buffer.write(pcm_chunk)
+    buffer.close()
+"""
+
+import os
+import tempfile
+import wave
+
+from alkvin.config import RECORDING_BUFFER_SIZE
+
+
+class RecordingBuffer:
+    """Memory-bounded buffer of 16-bit PCM data spilling to a WAV file."""
+
+    SAMPLE_WIDTH = 2
+
+    def __init__(self, spill_dir, frame_rate, channels, size=RECORDING_BUFFER_SIZE):
+        self.spill_dir = spill_dir
+        self.frame_rate = frame_rate
+        self.channels = channels
+
+        self.spill_path = None
+
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._length = 0
+        self._spill_file = None
+
+    @property
+    def spilled(self):
+        return self.spill_path is not None
+
+    def write(self, data):
+        data_length = len(data)
+
+        if self._length + data_length > len(self._buffer):
+            self._spill()
+
+        if data_length > len(self._buffer):
+            self._spill_file.writeframes(data)
+            return
+
+        self._view[self._length : self._length + data_length] = data
+        self._length += data_length
+
+    def getbuffer(self):
+        """Return the data held in memory (the whole recording if not spilled)."""
+
+        return self._view[: self._length]
+
+    def close(self):
+        """Move the data held in memory to the spill file, if there is one."""
+
+        if self._spill_file is None:
+            return
+
+        self._spill()
+        self._spill_file.close()
+        self._spill_file = None
+
+    def discard(self):
+        """Release the memory and remove the spill file."""
+
+        self.close()
+
+        if self.spill_path is not None and os.path.exists(self.spill_path):
+            os.remove(self.spill_path)
+
+        self._buffer = bytearray()
+        self._view = memoryview(self._buffer)
+        self._length = 0
+
+    def _spill(self):
+        if self._spill_file is None:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            spill_fd, self.spill_path = tempfile.mkstemp(
+                prefix="spill_", suffix=".wav", dir=self.spill_dir
+            )
+            os.close(spill_fd)
+
+            self._spill_file = wave.open(self.spill_path, "wb")
+            self._spill_file.setnchannels(self.channels)
+            self._spill_file.setsampwidth(self.SAMPLE_WIDTH)
+            self._spill_file.setframerate(self.frame_rate)
+
+        self._spill_file.writeframes(self._view[: self._length])
+        self._length = 0
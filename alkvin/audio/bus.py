@@ -1,86 +1,212 @@
+from datetime import datetime
+
+from kivy.clock import Clock
+from kivy.event import EventDispatcher
+from kivy.properties import BooleanProperty, NumericProperty, OptionProperty
+
+from alkvin.config import HANDS_FREE_ENDPOINT_SILENCE, PARTIAL_TRANSCRIPTION_PAUSE
+
 from .recorder import AudioRecorder
 from .player import AudioPlayer
+from .stream_player import StreamPlayer
+
+
+class AudioBus(EventDispatcher):
+    """Shared bus for recording and playing audio.
+
+    While audio is being recorded or played, a single ticker of the bus
+    publishes `on_progress(passed_time, total_time)` events every
+    `tick_interval` seconds. Audio widgets bind to them only while they are
+    active, so the work per tick doesn't grow with the number of widgets.
+    """
+
+    state = OptionProperty("idle", options=["idle", "recording", "playing"])
+
+    # In the hands-free mode recordings are closed by endpoint detection,
+    # i.e. automatically after the speech is followed by a silence.
+    hands_free = BooleanProperty(False)
+
+    # When enabled, windows of the recorded speech are published by
+    # `on_speech_window(recording_path, speech_window)` events while the
+    # recording continues, so they can be transcribed speculatively.
+    partial_transcription = BooleanProperty(False)
+
+    tick_interval = NumericProperty(0.2)
+
+    __events__ = ("on_progress", "on_speech_window")
 
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
 
-class AudioBus:
-    def __init__(self):
-        self._state = "idle"
+        self._ticker = None
 
         self._active_audio_widget = None
+        self._pending_recordings = {}  # recording_path: audio_recorder_widget
+        self._recording_times = {}  # recording_path: [started_at, stopped_at]
+        self._recording_path = None
 
         self._audio_recorder = AudioRecorder(
-            on_recording_finished=self._on_recording_finished
+            on_recording_finished=self._on_recording_finished,
+            on_recording_auto_stopped=self._on_recording_auto_stopped,
+            on_speech_window=self._on_speech_window,
         )
         self._audio_player = AudioPlayer(
             on_playback_finished=self._on_playback_finished
         )
+        self._stream_player = StreamPlayer(
+            on_playback_finished=self._on_playback_finished
+        )
+        self._active_player = self._audio_player
 
-    @property
-    def state(self):
-        return self._state
+    def on_hands_free(self, instance, value):
+        self._audio_recorder.endpoint_silence = (
+            HANDS_FREE_ENDPOINT_SILENCE if value else None
+        )
+
+    def on_partial_transcription(self, instance, value):
+        self._audio_recorder.window_pause = (
+            PARTIAL_TRANSCRIPTION_PAUSE if value else None
+        )
+
+    def on_state(self, instance, value):
+        if value == "idle":
+            self._stop_ticker()
+        elif self._ticker is None:
+            self._ticker = Clock.schedule_interval(self._tick, self.tick_interval)
+
+    def on_tick_interval(self, instance, value):
+        if self._ticker is not None:
+            self._stop_ticker()
+            self._ticker = Clock.schedule_interval(self._tick, value)
+
+    def on_progress(self, passed_time, total_time):
+        pass
+
+    def on_speech_window(self, recording_path, speech_window):
+        pass
+
+    def _tick(self, dt):
+        self.dispatch("on_progress", self.audio_passed_time, self.audio_total_time)
+
+    def _stop_ticker(self):
+        if self._ticker is not None:
+            self._ticker.cancel()
+            self._ticker = None
 
     @property
     def audio_passed_time(self):
-        if self._state == "idle":
+        if self.state == "idle":
             return 0
 
-        if self._state == "recording":
+        if self.state == "recording":
             return self._audio_recorder.recording_time
 
-        if self._state == "playing":
-            return self._audio_player.playing_time
+        if self.state == "playing":
+            return self._active_player.playing_time
 
     @property
     def audio_total_time(self):
-        if self._state == "idle":
+        if self.state == "idle":
             return 0
 
-        if self._state == "recording":
+        if self.state == "recording":
             return self._audio_recorder.recording_time
 
-        if self._state == "playing":
-            return self._audio_player.total_time
+        if self.state == "playing":
+            return self._active_player.total_time
 
-    def record(self, audio_recorder_widget, recording_path):
-        if self._state == "playing":
-            self._audio_player.stop()
+    def record(self, audio_recorder_widget, recording_path, recording_profile):
+        if self.state == "playing":
             self._active_audio_widget.state = "stopped"
+            self._active_player.stop()
 
         self._active_audio_widget = audio_recorder_widget
 
-        self._audio_recorder.record(recording_path)
+        self._audio_recorder.record(recording_path, recording_profile)
+        self._pending_recordings[recording_path] = audio_recorder_widget
+        self._recording_times[recording_path] = [datetime.now(), None]
+        self._recording_path = recording_path
 
-        self._state = "recording"
+        self.state = "recording"
 
     def play(self, audio_player_widget, audio_path):
-        if self._state == "recording":
+        if self.state == "recording":
             return
 
-        if self._state == "playing":
+        if self.state == "playing":
             self._active_audio_widget.state = "stopped"
-            self._audio_player.stop()
+            self._active_player.stop()
 
         self._active_audio_widget = audio_player_widget
+        self._active_player = self._audio_player
         self._audio_player.play(audio_path)
         self._active_audio_widget.state = "playing"
 
-        self._state = "playing"
+        self.state = "playing"
+
+    def play_stream(self, audio_player_widget, pcm_stream):
+        """Play audio while it's being written into the PCM stream."""
+
+        if self.state == "recording":
+            return
+
+        if self.state == "playing":
+            self._active_audio_widget.state = "stopped"
+            self._active_player.stop()
+
+        self._active_audio_widget = audio_player_widget
+        self._active_player = self._stream_player
+        self._stream_player.play(pcm_stream)
+        self._active_audio_widget.state = "playing"
+
+        self.state = "playing"
+
+    def prefetch(self, audio_paths):
+        """Preload audio files which are likely to be played soon."""
+
+        self._audio_player.prefetch(audio_paths)
 
     def stop(self, audio_widget=None):
-        if self._state == "recording" and audio_widget is self._active_audio_widget:
+        if self.state == "recording" and audio_widget is self._active_audio_widget:
+            # The recording gets encoded in the background, so the bus is free
+            # immediately and the recorder widget is notified once it's done.
             self._audio_recorder.stop()
+            self._recording_times[self._recording_path][1] = datetime.now()
 
-        if self._state == "playing":
-            self._audio_player.stop()
+            self._active_audio_widget = None
+            self.state = "idle"
 
-    def _on_recording_finished(self, recording_path):
-        if self._active_audio_widget is None:
+        if self.state == "playing":
+            self._active_player.stop()
+
+    def _on_recording_finished(self, recording_path, speech_segments, error=None):
+        audio_recorder_widget = self._pending_recordings.pop(recording_path, None)
+        recording_times = self._recording_times.pop(recording_path, [None, None])
+        if audio_recorder_widget is None:
             return
 
-        self._active_audio_widget.recording_path = recording_path
+        if error is not None:
+            audio_recorder_widget.dispatch(
+                "on_recording_dropped", recording_path, error
+            )
+            return
 
-        self._active_audio_widget = None
-        self._state = "idle"
+        audio_recorder_widget.speech_segments = speech_segments
+        (
+            audio_recorder_widget.recording_started_at,
+            audio_recorder_widget.recording_stopped_at,
+        ) = recording_times
+        audio_recorder_widget.recording_path = recording_path
+
+    def _on_speech_window(self, recording_path, speech_window):
+        self.dispatch("on_speech_window", recording_path, speech_window)
+
+    def _on_recording_auto_stopped(self):
+        if self.state != "recording":
+            return
+
+        # The recorder widget stops the recording through the bus itself.
+        self._active_audio_widget.state = "stopped"
 
     def _on_playback_finished(self):
         if self._active_audio_widget is None:
@@ -88,4 +214,4 @@ class AudioBus:
 
         self._active_audio_widget.state = "stopped"
         self._active_audio_widget = None
-        self._state = "idle"
+        self.state = "idle"
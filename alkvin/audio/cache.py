@@ -0,0 +1,88 @@
+"""
+Sound Cache
+===========
+
+This module defines the SoundCache class, which keeps a size-bounded LRU
+cache of loaded (decoded) sounds, so replaying a recently heard message does
+not load its audio file again.
+
+Sounds are keyed by the audio path and validated by the file modification
+time. Kivy sound providers have to be created on the UI thread, hence
+prefetching loads one sound per frame instead of using a worker thread.
+
+Example usage:
+    sound_cache = SoundCache(max_size=16)
+    sound_cache.prefetch(["message_1.opus", "message_2.opus"])
+    sound = sound_cache.get("message_1.opus")
+"""
+
+import os
+from collections import OrderedDict
+
+from kivy.clock import Clock
+from kivy.core.audio import SoundLoader
+
+from alkvin.config import SOUND_CACHE_SIZE
+
+
+class SoundCache:
+    """Size-bounded LRU cache of loaded sounds."""
+
+    def __init__(self, max_size=SOUND_CACHE_SIZE):
+        self.max_size = max_size
+
+        self._sounds = OrderedDict()  # audio_path: (mtime, sound)
+        self._prefetch_queue = []
+        self._prefetch_event = None
+
+    def get(self, audio_path):
+        """Return the loaded sound of the audio path, or None if not loadable."""
+
+        try:
+            mtime = os.path.getmtime(audio_path)
+        except OSError:
+            return None
+
+        cached_mtime, sound = self._sounds.pop(audio_path, (None, None))
+        if sound is not None and cached_mtime != mtime:
+            sound.unload()
+            sound = None
+
+        if sound is None:
+            sound = SoundLoader.load(audio_path)
+            if sound is None:
+                return None
+
+        self._sounds[audio_path] = (mtime, sound)
+        self._evict()
+
+        return sound
+
+    def prefetch(self, audio_paths):
+        """Load the sounds of the audio paths in the upcoming frames."""
+
+        self._prefetch_queue = [
+            audio_path for audio_path in audio_paths if audio_path not in self._sounds
+        ][: self.max_size]
+
+        if self._prefetch_queue and self._prefetch_event is None:
+            self._prefetch_event = Clock.schedule_interval(self._prefetch_next, 0)
+
+    def _prefetch_next(self, dt):
+        if not self._prefetch_queue:
+            self._prefetch_event = None
+            return False
+
+        self.get(self._prefetch_queue.pop(0))
+
+    def _evict(self):
+        for audio_path in list(self._sounds):
+            if len(self._sounds) <= self.max_size:
+                break
+
+            mtime, sound = self._sounds[audio_path]
+            if sound.state == "play":
+                continue
+
+            del self._sounds[audio_path]
+            sound.unload()
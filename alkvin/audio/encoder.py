@@ -0,0 +1,190 @@
+"""
+Audio Encoder
+=============
+
+This module defines the AudioEncoder class, which encodes finished recordings
+in a background worker, so that the (potentially long) export never blocks
+the UI thread, and the StreamingEncoder class, which encodes PCM chunks while
+the recording is still running.
+
+Both encoders store the audio in the format of the given recording profile.
+
+Example usage:
+    encoder = AudioEncoder()
+    encoder.encode(recording_buffer, "recording.opus", profile, on_encoded)
+
+    streaming_encoder = StreamingEncoder("recording.opus", profile, on_encoded)
+    streaming_encoder.write(pcm_chunk)
+    streaming_encoder.close()
+
+    # In a worker thread, without a callback
+    streaming_encoder = StreamingEncoder("speech.opus", profile)
+    streaming_encoder.write(pcm_chunk)
+    streaming_encoder.close()
+    streaming_encoder.wait()
+"""
+
+import queue
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from kivy.clock import mainthread
+from kivy.logger import Logger
+
+from pydub.utils import get_encoder_name
+
+
+def _encoder_command(input_args, recording_path, profile):
+    output_args = ["-ar", str(profile.rate), "-ac", str(profile.channels)]
+    output_args += ["-c:a", profile.codec]
+    if profile.bitrate is not None:
+        output_args += ["-b:a", profile.bitrate]
+    output_args += ["-f", profile.format]
+
+    return [
+        get_encoder_name(),
+        "-y",
+        "-loglevel",
+        "error",
+        *input_args,
+        *output_args,
+        str(recording_path),
+    ]
+
+
+def _pcm_input_args(frame_rate, channels):
+    return ["-f", "s16le", "-ar", str(frame_rate), "-ac", str(channels), "-i", "pipe:0"]
+
+
+@mainthread
+def _notify(on_encoded, recording_path, error):
+    if error is not None:
+        Logger.error(f"AudioEncoder: Encoding of {recording_path} failed: {error}")
+
+    on_encoded(recording_path, error)
+
+
+class AudioEncoder:
+    """Background worker encoding buffered recordings to audio files."""
+
+    def __init__(self, max_workers=1):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="audio_encoder"
+        )
+
+    def encode(self, recording_buffer, recording_path, profile, on_encoded):
+        """Schedule encoding of the recording buffer into the recording path.
+
+        The `on_encoded(recording_path, error)` callback is called on the main
+        (UI) thread when the encoding finishes.
+        """
+
+        future = self._executor.submit(
+            self._encode, recording_buffer, recording_path, profile
+        )
+        future.add_done_callback(
+            lambda future: _notify(on_encoded, recording_path, future.exception())
+        )
+
+        return future
+
+    def _encode(self, recording_buffer, recording_path, profile):
+        try:
+            recording_buffer.close()
+
+            if recording_buffer.spilled:
+                # Let the encoder read the spilled recording from the disk
+                # instead of loading it back to memory.
+                input_args = ["-i", recording_buffer.spill_path]
+                pcm_data = None
+            else:
+                input_args = _pcm_input_args(
+                    recording_buffer.frame_rate, recording_buffer.channels
+                )
+                pcm_data = recording_buffer.getbuffer()
+
+            completed_process = subprocess.run(
+                _encoder_command(input_args, recording_path, profile),
+                input=pcm_data,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+            )
+            if completed_process.returncode != 0:
+                raise RuntimeError(
+                    completed_process.stderr.decode(errors="replace").strip()
+                )
+        finally:
+            recording_buffer.discard()
+
+
+class StreamingEncoder:
+    """Incremental encoder piping raw 16-bit PCM chunks into an ffmpeg process.
+
+    Chunks are queued by the producer (the PortAudio stream callback) and
+    written to the encoder by a consumer thread, so closing the encoder only
+    flushes the last few chunks, no matter how long the recording is.
+
+    The `on_encoded(recording_path, error)` callback is called on the main
+    (UI) thread when the encoding finishes; a worker thread can wait for it
+    by `wait` instead.
+    """
+
+    def __init__(self, recording_path, profile, on_encoded=None):
+        self._recording_path = recording_path
+        self._on_encoded = on_encoded
+        self._error = None
+
+        self._process = subprocess.Popen(
+            _encoder_command(
+                _pcm_input_args(profile.rate, profile.channels), recording_path, profile
+            ),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+
+        self._chunks = queue.Queue()
+        self._consumer = threading.Thread(
+            target=self._consume, name="streaming_encoder", daemon=True
+        )
+        self._consumer.start()
+
+    def write(self, pcm_chunk):
+        self._chunks.put(pcm_chunk)
+
+    def close(self):
+        """Flush the queued chunks and finalize the recording file."""
+
+        self._chunks.put(None)
+
+    def wait(self):
+        """Wait for the closed encoder to finish, raising its error."""
+
+        self._consumer.join()
+
+        if self._error is not None:
+            raise self._error
+
+    def _consume(self):
+        error = None
+
+        try:
+            while True:
+                pcm_chunk = self._chunks.get()
+                if pcm_chunk is None:
+                    break
+
+                self._process.stdin.write(pcm_chunk)
+
+            self._process.stdin.close()
+            stderr = self._process.stderr.read()
+            if self._process.wait() != 0:
+                raise RuntimeError(stderr.decode(errors="replace").strip())
+        except Exception as e:
+            self._process.kill()
+            error = e
+
+        self._error = error
+        if self._on_encoded is not None:
+            _notify(self._on_encoded, self._recording_path, error)
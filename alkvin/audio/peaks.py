@@ -0,0 +1,116 @@
+"""
+Waveform Peaks
+==============
+
+This module computes compact waveform previews of audio files. The peaks of
+an audio file are the minimum and maximum sample values of every 10 ms
+window, scaled to int8, and they're stored in a sidecar file next to it
+(`<audio_path>.peaks`), so the waveform can be shown without decoding the
+audio.
+
+Example usage:
+    peaks_accumulator = PeaksAccumulator(frame_rate=16000)
+    peaks_accumulator.add(pcm_chunk)
+    save_peaks("message.opus", peaks_accumulator.peaks)
+
+    peaks = load_peaks("message.opus")
+"""
+
+import os
+
+import numpy as np
+
+
+PEAKS_WINDOW = 0.01  # seconds
+
+PEAKS_EXTENSION = ".peaks"
+
+
+def compute_peaks(samples, window_length):
+    """Return the (min, max) int8 peaks of every window of the int16 samples."""
+
+    window_count = -(-len(samples) // window_length)  # ceil division
+    if window_count == 0:
+        return np.empty((0, 2), dtype=np.int8)
+
+    padded_samples = np.zeros(window_count * window_length, dtype=np.int16)
+    padded_samples[: len(samples)] = samples
+    windows = padded_samples.reshape(window_count, window_length)
+
+    peaks = np.stack([windows.min(axis=1), windows.max(axis=1)], axis=1)
+
+    return (peaks >> 8).astype(np.int8)
+
+
+class PeaksAccumulator:
+    """Incremental computation of peaks of a recorded 16-bit PCM stream."""
+
+    def __init__(self, frame_rate, channels=1):
+        self._channels = channels
+        self._window_length = max(1, int(frame_rate * PEAKS_WINDOW))
+        self._remainder = np.empty(0, dtype=np.int16)
+        self._peaks = []
+
+    @property
+    def peaks(self):
+        remainder_peaks = compute_peaks(self._remainder, len(self._remainder) or 1)
+
+        return np.concatenate(self._peaks + [remainder_peaks])
+
+    def add(self, pcm_chunk):
+        samples = np.frombuffer(pcm_chunk, dtype=np.int16)
+        if self._channels > 1:
+            samples = samples.reshape(-1, self._channels).mean(axis=1).astype(np.int16)
+
+        samples = np.concatenate([self._remainder, samples])
+        complete_length = len(samples) // self._window_length * self._window_length
+
+        self._peaks.append(
+            compute_peaks(samples[:complete_length], self._window_length)
+        )
+        self._remainder = samples[complete_length:]
+
+
+def get_peaks_path(audio_path):
+    return f"{audio_path}{PEAKS_EXTENSION}"
+
+
+def save_peaks(audio_path, peaks):
+    peaks.astype(np.int8).tofile(get_peaks_path(audio_path))
+
+
+def load_peaks(audio_path):
+    """Return the peaks of the audio file, or None if they aren't computed."""
+
+    peaks_path = get_peaks_path(audio_path)
+    if not os.path.exists(peaks_path):
+        return None
+
+    return np.fromfile(peaks_path, dtype=np.int8).reshape(-1, 2)
+
+
+def compute_file_peaks(audio_path):
+    """Decode the audio file, compute its peaks and store them in the sidecar."""
+
+    from pydub import AudioSegment
+
+    audio_segment = (
+        AudioSegment.from_file(audio_path).set_channels(1).set_sample_width(2)
+    )
+    samples = np.array(audio_segment.get_array_of_samples(), dtype=np.int16)
+    peaks = compute_peaks(samples, max(1, int(audio_segment.frame_rate * PEAKS_WINDOW)))
+    save_peaks(audio_path, peaks)
+
+    return peaks
+
+
+def move_peaks(audio_path, new_audio_path):
+    """Move the peaks sidecar along with its audio file."""
+
+    if os.path.exists(get_peaks_path(audio_path)):
+        os.replace(get_peaks_path(audio_path), get_peaks_path(new_audio_path))
+
+
+def remove_peaks(audio_path):
+    if os.path.exists(get_peaks_path(audio_path)):
+        os.remove(get_peaks_path(audio_path))
@@ -1,10 +1,12 @@
-from kivy.core.audio import SoundLoader
+from .cache import SoundCache
 
 
 class AudioPlayer:
     def __init__(self, on_playback_finished):
         self._on_playback_finished = on_playback_finished
 
+        self._sound_cache = SoundCache()
+
         self.audio = None
 
     @property
@@ -15,12 +17,19 @@ class AudioPlayer:
     def total_time(self):
         return self.audio.length
 
+    def prefetch(self, audio_paths):
+        self._sound_cache.prefetch(audio_paths)
+
     def play(self, audio_path):
-        self.audio = SoundLoader.load(audio_path)
-        self.audio.bind(on_stop=lambda dt: self._on_playback_finished())
+        self.audio = self._sound_cache.get(audio_path)
+        self.audio.bind(on_stop=self._on_audio_stop)
         self.audio.volume = 0.5
         self.audio.play()
 
+    def _on_audio_stop(self, audio):
+        audio.unbind(on_stop=self._on_audio_stop)
+        self._on_playback_finished()
+
     def stop(self):
         self.audio.stop()
         self.audio = None
@@ -0,0 +1,38 @@
+"""
+Recording Profiles
+==================
+
+This module defines the recording profiles, i.e. the capture and storage
+formats the AudioRecorder can record in.
+
+The default "speech" profile records 16 kHz mono audio and stores it as
+low-bitrate Opus, which is all the speech-to-text models need. The "archive"
+profile stores lossless FLAC and the "compatible" profile keeps the original
+44.1 kHz MP3 recordings.
+
+Example usage:
+    profile = get_recording_profile("speech")
+"""
+
+from collections import namedtuple
+
+
+RecordingProfile = namedtuple(
+    "RecordingProfile", ["rate", "channels", "format", "codec", "bitrate", "extension"]
+)
+
+RECORDING_PROFILES = {
+    "speech": RecordingProfile(16000, 1, "opus", "libopus", "24k", "opus"),
+    "archive": RecordingProfile(48000, 1, "flac", "flac", None, "flac"),
+    "compatible": RecordingProfile(44100, 1, "mp3", "libmp3lame", "128k", "mp3"),
+}
+
+DEFAULT_RECORDING_PROFILE = "speech"
+
+
+def get_recording_profile(profile_name):
+    """Return the recording profile of the given name, or the default one."""
+
+    return RECORDING_PROFILES.get(
+        profile_name, RECORDING_PROFILES[DEFAULT_RECORDING_PROFILE]
+    )
@@ -1,59 +1,248 @@
+import os
+
 import pyaudio
 
-from pydub import AudioSegment
+from kivy.clock import mainthread
+from kivy.logger import Logger
+
+from alkvin.config import RECORDINGS_DIR, RECORDING_MAX_DURATION
+
+from .buffer import RecordingBuffer
+from .encoder import AudioEncoder, StreamingEncoder
+from .peaks import PeaksAccumulator, save_peaks
+from .profiles import DEFAULT_RECORDING_PROFILE, get_recording_profile
+from .vad import VoiceActivityDetector
+from .windows import SpeechWindowCutter
+
+
+class NoSpeechError(Exception):
+    """No speech was detected in a recording trimmed of silence."""
 
 
 class AudioRecorder:
     # PyAudio parameters
     CHUNK = 1024
     FORMAT = pyaudio.paInt16
-    CHANNELS = 1
-    RATE = 44100
 
-    def __init__(self, on_recording_finished):
+    def __init__(
+        self,
+        on_recording_finished,
+        on_recording_auto_stopped=None,
+        on_speech_window=None,
+        streaming=True,
+        trim_silence=True,
+        max_duration=RECORDING_MAX_DURATION,
+    ):
         self.on_recording_finished = on_recording_finished
+        self.on_recording_auto_stopped = on_recording_auto_stopped
+        self.on_speech_window = on_speech_window
+
+        # In streaming mode the audio is encoded while it's being recorded,
+        # otherwise the frames are buffered and encoded after stopping.
+        self.streaming = streaming
+
+        # Leading and trailing silence is dropped and long pauses shortened
+        # before the audio gets to the encoder.
+        self.trim_silence = trim_silence
+
+        # When set, the recording is stopped automatically after the speech
+        # is followed by the given number of seconds of silence.
+        self.endpoint_silence = None
+
+        # When set, the recorded speech is cut into overlapping windows at
+        # pauses of the given number of seconds, which are passed to
+        # `on_speech_window(recording_path, speech_window)` while the recording
+        # continues, e.g. to be transcribed speculatively.
+        self.window_pause = None
+
+        self.max_duration = max_duration
 
         self._p = pyaudio.PyAudio()
+        self._encoder = AudioEncoder()
+        self._streaming_encoder = None
         self._stream = None
-        self._frames = []
+        self._buffer = None
+        self._vad = None
+        self._peaks_accumulator = None
+        self._window_cutter = None
+        self._window_speech = False  # Speech has been recorded since the last cut
+        self._speech_segments = {}  # recording_path: speech_segments
+        self._peaks = {}  # recording_path: peaks
         self._frame_count = 0
         self._recording_path = None
+        self._profile = get_recording_profile(DEFAULT_RECORDING_PROFILE)
 
     @property
     def recording_time(self):
         if self._stream is None or not self._stream.is_active():
             return 0
 
-        return self._frame_count / self.RATE
+        return self._frame_count / self._profile.rate
 
-    def record(self, recording_path):
+    def record(self, recording_path, profile_name=DEFAULT_RECORDING_PROFILE):
         self._recording_path = recording_path
-        self._frames = []
+        self._profile = get_recording_profile(profile_name)
+        self._buffer = None
         self._frame_count = 0
 
+        self._vad = VoiceActivityDetector(self._profile.rate, self._profile.channels)
+        self._peaks_accumulator = PeaksAccumulator(
+            self._profile.rate, self._profile.channels
+        )
+
+        self._window_cutter = None
+        self._window_speech = False
+        if self.window_pause is not None and self.on_speech_window is not None:
+            self._window_cutter = SpeechWindowCutter(
+                self._profile.rate, self._profile.channels
+            )
+
+        self._streaming_encoder = None
+        if self.streaming:
+            try:
+                self._streaming_encoder = StreamingEncoder(
+                    recording_path,
+                    self._profile,
+                    on_encoded=self._on_encoded,
+                )
+            except OSError as e:
+                Logger.warning(f"AudioRecorder: Streaming encoder unavailable: {e}")
+
+        if self._streaming_encoder is None:
+            self._buffer = RecordingBuffer(
+                RECORDINGS_DIR,
+                frame_rate=self._profile.rate,
+                channels=self._profile.channels,
+            )
+
         self._stream = self._p.open(
             format=self.FORMAT,
-            channels=self.CHANNELS,
-            rate=self.RATE,
+            channels=self._profile.channels,
+            rate=self._profile.rate,
             input=True,
             frames_per_buffer=self.CHUNK,
             stream_callback=self._stream_callback,
         )
 
     def _stream_callback(self, in_data, frame_count, time_info, status):
-        self._frames.append(in_data)
+        max_frame_count = int(self.max_duration * self._profile.rate)
+        if self._frame_count + frame_count >= max_frame_count:
+            frame_count = max_frame_count - self._frame_count
+            in_data = in_data[: frame_count * self._profile.channels * 2]
+            flag = pyaudio.paComplete
+        else:
+            flag = pyaudio.paContinue
+
+        pcm_chunks = self._vad.process(in_data)
+        self._write(pcm_chunks if self.trim_silence else [in_data])
         self._frame_count += frame_count
 
-        return in_data, pyaudio.paContinue
+        if self._window_cutter is not None:
+            self._cut_speech_window()
+
+        if (
+            self.endpoint_silence is not None
+            and self._vad.pause_duration >= self.endpoint_silence
+        ):
+            flag = pyaudio.paComplete
+
+        if flag == pyaudio.paComplete:
+            self._auto_stop(self._recording_path)
+
+        return in_data, flag
+
+    def _write(self, pcm_chunks):
+        for pcm_chunk in pcm_chunks:
+            self._peaks_accumulator.add(pcm_chunk)
+
+            if self._window_cutter is not None:
+                self._window_cutter.add(pcm_chunk)
+
+            if self._streaming_encoder is not None:
+                self._streaming_encoder.write(pcm_chunk)
+            else:
+                self._buffer.write(pcm_chunk)
+
+    def _cut_speech_window(self):
+        if self._vad.speech_detected and self._vad.pause_duration == 0:
+            self._window_speech = True
+
+        if self._window_cutter.must_cut() or (
+            self._window_speech
+            and self._vad.pause_duration >= self.window_pause
+            and self._window_cutter.can_cut()
+        ):
+            self._window_speech = False
+            self._notify_speech_window(
+                self._recording_path, self._window_cutter.cut()
+            )
+
+    @mainthread
+    def _notify_speech_window(self, recording_path, speech_window):
+        self.on_speech_window(recording_path, speech_window)
+
+    @mainthread
+    def _auto_stop(self, recording_path):
+        if self._stream is None or recording_path != self._recording_path:
+            return  # The recording has already been stopped
+
+        if self.on_recording_auto_stopped is not None:
+            self.on_recording_auto_stopped()
 
     def stop(self):
-        import os
+        """Stop capturing and finish encoding of the captured frames.
+
+        Returns immediately; `on_recording_finished(recording_path,
+        speech_segments, error)` is called once the recording file is written.
+        """
 
-        audio_segment = AudioSegment(
-            b"".join(self._frames),
-            sample_width=2,
-            frame_rate=self.RATE,
-            channels=self.CHANNELS,
+        if self._stream is not None:
+            self._stream.stop_stream()
+            self._stream.close()
+            self._stream = None
+
+        if self._vad is not None:
+            pcm_chunks = self._vad.flush()
+            if self.trim_silence:
+                self._write(pcm_chunks)
+                self._speech_segments[self._recording_path] = self._vad.segments
+            self._vad = None
+
+        self._peaks[self._recording_path] = self._peaks_accumulator.peaks
+        self._peaks_accumulator = None
+
+        if self._window_cutter is not None:
+            speech_window = self._window_cutter.cut(is_last=True)
+            if not self._window_speech:
+                # Only the silence after the last cut is left
+                speech_window = speech_window._replace(pcm_data=b"")
+            self._notify_speech_window(self._recording_path, speech_window)
+            self._window_cutter = None
+
+        if self._streaming_encoder is not None:
+            self._streaming_encoder.close()
+            self._streaming_encoder = None
+            return
+
+        recording_buffer, self._buffer = self._buffer, None
+
+        self._encoder.encode(
+            recording_buffer,
+            self._recording_path,
+            self._profile,
+            on_encoded=self._on_encoded,
         )
-        audio_segment.export(self._recording_path, format="mp3")
-        self.on_recording_finished(self._recording_path)
+
+    def _on_encoded(self, recording_path, error):
+        speech_segments = self._speech_segments.pop(recording_path, None)
+        peaks = self._peaks.pop(recording_path, None)
+
+        if error is None and speech_segments == []:
+            # All the audio was trimmed as silence, so the file is empty
+            if os.path.exists(recording_path):
+                os.remove(recording_path)
+            error = NoSpeechError("No speech was recorded")
+        elif error is None and peaks is not None:
+            save_peaks(recording_path, peaks)
+
+        self.on_recording_finished(recording_path, speech_segments or [], error)
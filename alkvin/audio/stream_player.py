@@ -0,0 +1,197 @@
+"""
+Stream Player
+=============
+
+This module defines the StreamPlayer class, which plays raw 16-bit PCM audio
+while it's still being produced (e.g. synthesized), the PCMStream class,
+the sink the producer writes the audio into, and the PCMStreamQueue class,
+which plays a sequence of such streams gaplessly, in order.
+
+Example usage:
+    stream_player = StreamPlayer(on_playback_finished)
+    pcm_stream = PCMStream(frame_rate=24000)
+    stream_player.play(pcm_stream)
+
+    # In a producer thread
+    pcm_stream.write(pcm_chunk)
+    pcm_stream.close()
+
+    pcm_stream_queue = PCMStreamQueue(frame_rate=24000)
+    stream_player.play(pcm_stream_queue)
+    pcm_stream_queue.append(first_pcm_stream)
+    pcm_stream_queue.append(second_pcm_stream)
+    pcm_stream_queue.close()
+"""
+
+import threading
+
+import pyaudio
+
+from kivy.clock import mainthread
+
+
+class PCMStream:
+    """Thread-safe sink of streamed 16-bit mono PCM audio."""
+
+    SAMPLE_WIDTH = 2
+
+    def __init__(self, frame_rate):
+        self.frame_rate = frame_rate
+
+        self.received_frame_count = 0
+
+        self._lock = threading.Lock()
+        self._buffer = bytearray()
+        self._closed = False
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def write(self, pcm_chunk):
+        with self._lock:
+            self._buffer += pcm_chunk
+            self.received_frame_count += len(pcm_chunk) // self.SAMPLE_WIDTH
+
+    def close(self):
+        """Mark the end of the stream."""
+
+        with self._lock:
+            self._closed = True
+
+    def read(self, frame_count):
+        """Return up to frame_count frames and whether the stream is drained."""
+
+        byte_count = frame_count * self.SAMPLE_WIDTH
+        with self._lock:
+            pcm_data = bytes(self._buffer[:byte_count])
+            del self._buffer[:byte_count]
+
+            return pcm_data, self._closed and not self._buffer
+
+
+class PCMStreamQueue:
+    """Sequence of PCM streams read one after another.
+
+    A stream is read only after all the previous ones are drained, even if
+    the later streams receive their audio sooner.
+    """
+
+    def __init__(self, frame_rate):
+        self.frame_rate = frame_rate
+
+        self._lock = threading.Lock()
+        self._pcm_streams = []
+        self._current_index = 0
+        self._closed = False
+
+    @property
+    def received_frame_count(self):
+        with self._lock:
+            return sum(
+                pcm_stream.received_frame_count for pcm_stream in self._pcm_streams
+            )
+
+    def append(self, pcm_stream):
+        with self._lock:
+            self._pcm_streams.append(pcm_stream)
+
+    def close(self):
+        """Mark that no more streams will be appended."""
+
+        with self._lock:
+            self._closed = True
+
+    def read(self, frame_count):
+        """Return up to frame_count frames and whether the queue is drained."""
+
+        pcm_data = b""
+        with self._lock:
+            while self._current_index < len(self._pcm_streams):
+                missing_frame_count = (
+                    frame_count - len(pcm_data) // PCMStream.SAMPLE_WIDTH
+                )
+                if missing_frame_count == 0:
+                    break
+
+                pcm_stream = self._pcm_streams[self._current_index]
+                stream_data, drained = pcm_stream.read(missing_frame_count)
+                pcm_data += stream_data
+
+                if drained:
+                    self._current_index += 1
+                elif not stream_data:
+                    break  # The current stream underruns
+
+            drained = self._closed and self._current_index == len(self._pcm_streams)
+
+            return pcm_data, drained
+
+
+class StreamPlayer:
+    CHUNK = 1024
+    FORMAT = pyaudio.paInt16
+
+    def __init__(self, on_playback_finished):
+        self._on_playback_finished = on_playback_finished
+
+        self._p = pyaudio.PyAudio()
+        self._stream = None
+        self._pcm_stream = None
+        self._played_frame_count = 0
+
+    @property
+    def playing_time(self):
+        return self._played_frame_count / self._pcm_stream.frame_rate
+
+    @property
+    def total_time(self):
+        """Duration of the audio received so far."""
+
+        return self._pcm_stream.received_frame_count / self._pcm_stream.frame_rate
+
+    def play(self, pcm_stream):
+        """Play the stream; silence is played while the stream underruns."""
+
+        self._pcm_stream = pcm_stream
+        self._played_frame_count = 0
+
+        self._stream = self._p.open(
+            format=self.FORMAT,
+            channels=1,
+            rate=pcm_stream.frame_rate,
+            output=True,
+            frames_per_buffer=self.CHUNK,
+            stream_callback=self._stream_callback,
+        )
+
+    def _stream_callback(self, in_data, frame_count, time_info, status):
+        pcm_data, drained = self._pcm_stream.read(frame_count)
+        self._played_frame_count += len(pcm_data) // PCMStream.SAMPLE_WIDTH
+
+        # Pad underruns with silence
+        pcm_data += b"\0" * (frame_count * PCMStream.SAMPLE_WIDTH - len(pcm_data))
+
+        if drained:
+            self._finish(self._stream)
+            return pcm_data, pyaudio.paComplete
+
+        return pcm_data, pyaudio.paContinue
+
+    @mainthread
+    def _finish(self, stream):
+        if stream is not self._stream:
+            return  # The playback has already been stopped
+
+        self._close_stream()
+        self._on_playback_finished()
+
+    def _close_stream(self):
+        self._stream.stop_stream()
+        self._stream.close()
+        self._stream = None
+
+    def stop(self):
+        if self._stream is not None:
+            self._close_stream()
+        self._on_playback_finished()
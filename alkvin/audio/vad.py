@@ -0,0 +1,179 @@
+"""
+Voice Activity Detection
+========================
+
+This module defines the VoiceActivityDetector class, which classifies chunks
+of recorded 16-bit PCM audio as speech or silence by their energy and trims
+the silence on the fly: leading and trailing silence is dropped (except for
+a short padding) and long pauses in the speech are shortened.
+
+The detector also keeps the speech segmentation of the trimmed audio as
+a list of `(start, end)` times in seconds.
+
+Example usage:
+    vad = VoiceActivityDetector(frame_rate=16000)
+    for pcm_chunk in pcm_chunks:
+        for kept_chunk in vad.process(pcm_chunk):
+            sink.write(kept_chunk)
+    for kept_chunk in vad.flush():
+        sink.write(kept_chunk)
+    print(vad.segments)
+"""
+
+from collections import deque
+
+import numpy as np
+
+from alkvin.config import VAD_MAX_PAUSE, VAD_PADDING, VAD_THRESHOLD
+
+
+class VoiceActivityDetector:
+    """Incremental energy-based voice activity detector and silence trimmer."""
+
+    SAMPLE_WIDTH = 2
+    FRAME_DURATION = 0.01  # seconds
+    SEGMENT_GAP = 0.3  # seconds, shorter pauses don't split speech segments
+
+    def __init__(
+        self,
+        frame_rate,
+        channels=1,
+        threshold=VAD_THRESHOLD,
+        padding=VAD_PADDING,
+        max_pause=VAD_MAX_PAUSE,
+    ):
+        self.threshold = threshold
+        self.padding = padding
+        self.max_pause = max_pause
+
+        self.segments = []
+
+        self._channels = channels
+        self._frame_length = max(1, int(frame_rate * self.FRAME_DURATION)) * channels
+        self._bytes_per_second = frame_rate * channels * self.SAMPLE_WIDTH
+
+        self._output_time = 0.0
+        self._segment_start = None
+        self._speech_end = None
+
+        # Silence after the last speech chunk is held back until it's known
+        # whether the speech continues; only its head and tail are kept.
+        self._silence_head = []
+        self._silence_head_duration = 0.0
+        self._silence_tail = deque()
+        self._silence_tail_duration = 0.0
+        self._silence_duration = 0.0
+
+    @property
+    def speech_detected(self):
+        return self._segment_start is not None
+
+    @property
+    def pause_duration(self):
+        """Duration of the silence since the last speech chunk."""
+
+        return self._silence_duration if self.speech_detected else 0.0
+
+    def is_speech(self, pcm_chunk):
+        """Return True if any 10 ms frame of the chunk exceeds the threshold."""
+
+        samples = np.frombuffer(pcm_chunk, dtype=np.int16)
+        frame_count = len(samples) // self._frame_length
+        if frame_count == 0:
+            frames = samples.reshape(1, -1)
+        else:
+            frames = samples[: frame_count * self._frame_length].reshape(
+                frame_count, self._frame_length
+            )
+
+        frames = frames.astype(np.float32) / 32768.0
+        rms = np.sqrt(np.mean(np.square(frames), axis=1))
+        levels = 20.0 * np.log10(np.maximum(rms, 1e-10))
+
+        return bool(np.any(levels > self.threshold))
+
+    def process(self, pcm_chunk):
+        """Process the next recorded chunk and return the chunks to keep."""
+
+        chunk_duration = len(pcm_chunk) / self._bytes_per_second
+
+        if not self.is_speech(pcm_chunk):
+            self._hold_silence(pcm_chunk, chunk_duration)
+            return []
+
+        if self._segment_start is None:
+            kept_chunks = list(self._silence_tail)
+            self._segment_start = self._output_time + self._silence_tail_duration
+        else:
+            kept_chunks = self._silence_head + list(self._silence_tail)
+            if self._silence_duration >= self.SEGMENT_GAP:
+                self.segments.append(self._close_segment())
+                self._segment_start = (
+                    self._output_time
+                    + self._silence_head_duration
+                    + self._silence_tail_duration
+                )
+
+        kept_chunks.append(pcm_chunk)
+        self._output_time += (
+            self._silence_head_duration + self._silence_tail_duration + chunk_duration
+        )
+        self._speech_end = self._output_time
+        self._reset_silence()
+
+        return kept_chunks
+
+    def flush(self):
+        """Finish the recording and return the trailing padding to keep."""
+
+        if self._segment_start is None:
+            return []
+
+        kept_chunks = []
+        kept_duration = 0.0
+        for pcm_chunk in self._silence_head + list(self._silence_tail):
+            if kept_duration >= self.padding:
+                break
+
+            kept_chunks.append(pcm_chunk)
+            kept_duration += len(pcm_chunk) / self._bytes_per_second
+
+        self.segments.append(self._close_segment())
+        self._segment_start = None
+        self._output_time += kept_duration
+        self._reset_silence()
+
+        return kept_chunks
+
+    def _hold_silence(self, pcm_chunk, chunk_duration):
+        if self._segment_start is None:
+            # Leading silence, only the padding before the speech is kept.
+            tail_limit = self.padding
+        elif self.max_pause is None:
+            tail_limit = None
+        else:
+            tail_limit = self.max_pause / 2
+
+            if self._silence_head_duration < self.max_pause / 2:
+                self._silence_head.append(pcm_chunk)
+                self._silence_head_duration += chunk_duration
+                self._silence_duration += chunk_duration
+                return
+
+        self._silence_tail.append(pcm_chunk)
+        self._silence_tail_duration += chunk_duration
+        self._silence_duration += chunk_duration
+
+        while tail_limit is not None and self._silence_tail_duration > tail_limit:
+            dropped_chunk = self._silence_tail.popleft()
+            self._silence_tail_duration -= len(dropped_chunk) / self._bytes_per_second
+
+    def _close_segment(self):
+        return (round(self._segment_start, 3), round(self._speech_end, 3))
+
+    def _reset_silence(self):
+        self._silence_head = []
+        self._silence_head_duration = 0.0
+        self._silence_tail.clear()
+        self._silence_tail_duration = 0.0
+        self._silence_duration = 0.0
@@ -0,0 +1,99 @@
+"""
+Speech Windows
+==============
+
+This module defines the SpeechWindowCutter class, which cuts a recorded 16-bit
+PCM stream into overlapping windows, so the speech can be transcribed while
+it's still being recorded. Every window starts with the tail of the previous
+one, so the words at its boundary can be matched when the transcripts of the
+windows are merged.
+
+Example usage:
+    speech_window_cutter = SpeechWindowCutter(frame_rate=16000)
+    speech_window_cutter.add(pcm_chunk)
+    if speech_window_cutter.can_cut():  # e.g. in a pause of the speech
+        speech_window = speech_window_cutter.cut()
+    last_speech_window = speech_window_cutter.cut(is_last=True)
+"""
+
+from collections import namedtuple
+
+from alkvin.config import (
+    PARTIAL_TRANSCRIPTION_MAX_WINDOW,
+    PARTIAL_TRANSCRIPTION_MIN_WINDOW,
+    PARTIAL_TRANSCRIPTION_OVERLAP,
+)
+
+
+SpeechWindow = namedtuple(
+    "SpeechWindow", ["index", "pcm_data", "frame_rate", "channels", "is_last"]
+)
+
+
+class SpeechWindowCutter:
+    """Incremental cutting of a PCM stream into overlapping windows."""
+
+    SAMPLE_WIDTH = 2
+
+    def __init__(
+        self,
+        frame_rate,
+        channels=1,
+        min_window=PARTIAL_TRANSCRIPTION_MIN_WINDOW,
+        max_window=PARTIAL_TRANSCRIPTION_MAX_WINDOW,
+        overlap=PARTIAL_TRANSCRIPTION_OVERLAP,
+    ):
+        self._frame_rate = frame_rate
+        self._channels = channels
+
+        frame_size = channels * self.SAMPLE_WIDTH
+        self._min_window_size = int(min_window * frame_rate) * frame_size
+        self._max_window_size = int(max_window * frame_rate) * frame_size
+        self._overlap_size = int(overlap * frame_rate) * frame_size
+
+        self._pcm_data = bytearray()
+        self._overlap_length = 0  # bytes of the window repeated from the previous one
+        self._window_count = 0
+
+    @property
+    def new_size(self):
+        """Size of the audio added since the last cut (in bytes)."""
+
+        return len(self._pcm_data) - self._overlap_length
+
+    def add(self, pcm_chunk):
+        self._pcm_data += pcm_chunk
+
+    def can_cut(self):
+        return self.new_size >= self._min_window_size
+
+    def must_cut(self):
+        """Return True if the window is too long to wait for a pause."""
+
+        return self.new_size >= self._max_window_size
+
+    def cut(self, is_last=False):
+        """Return the window of the audio added since the last cut.
+
+        Returns None if no audio has been added, except for the last window,
+        which is always returned (empty if there's no new audio), so it marks
+        the end of the stream.
+        """
+
+        if self.new_size <= 0 and not is_last:
+            speech_window = None
+        else:
+            speech_window = SpeechWindow(
+                self._window_count,
+                bytes(self._pcm_data) if self.new_size > 0 else b"",
+                self._frame_rate,
+                self._channels,
+                is_last,
+            )
+            self._window_count += 1
+
+        overlap = self._pcm_data[-self._overlap_size :] if self._overlap_size else b""
+        self._pcm_data = bytearray(overlap)
+        self._overlap_length = len(overlap)
+
+        return speech_window
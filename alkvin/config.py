@@ -10,11 +10,94 @@ APP_ROOT_DIR = Path(__file__).parent.parent
 
 RESOURCES_DIR = APP_ROOT_DIR / "resources"
 
+DB_PATH = RESOURCES_DIR / "alkvin.db"
+
+# SQLite settings applied to every database connection
+DB_PRAGMAS = {
+    # Readers (e.g. worker threads) don't block the writer and the commits
+    # don't need a full sync of the database file
+    "journal_mode": "wal",
+    "synchronous": "normal",
+    "cache_size": -64 * 1024,  # KiB (when negative)
+    "mmap_size": 256 * 1024 * 1024,  # bytes
+    "temp_store": "memory",
+    "foreign_keys": 1,
+}
+
 AUDIO_DIR = RESOURCES_DIR / "audio"
 
 RECORDINGS_DIR = AUDIO_DIR / "recordings"
 
 CHATS_AUDIO_DIR = AUDIO_DIR / "chats"
 
+# Speech files shared by all chats, see `SpeechBlob`
+SPEECH_STORE_DIR = AUDIO_DIR / "speech"
+
+# Memory budget of a recording buffer, longer recordings are spilled to disk
+RECORDING_BUFFER_SIZE = 8 * 1024 * 1024  # bytes
+
+# Recordings are stopped automatically when they reach the maximum duration
+RECORDING_MAX_DURATION = 60 * 60  # seconds
+
+# Voice activity detection trimming silence from recordings
+VAD_THRESHOLD = -45.0  # dBFS, quieter audio is considered silence
+VAD_PADDING = 0.3  # seconds of silence kept before and after speech
+VAD_MAX_PAUSE = 1.5  # seconds, longer pauses are shortened (None keeps them)
+
+# Silence after speech closing a recording in the hands-free conversation mode
+HANDS_FREE_ENDPOINT_SILENCE = 1.0  # seconds
+
+# Speculative transcription of recordings in overlapping windows cut at pauses
+# of the speech while the recording continues
+PARTIAL_TRANSCRIPTION_PAUSE = 0.4  # seconds of silence allowing a cut
+PARTIAL_TRANSCRIPTION_MIN_WINDOW = 3.0  # seconds of new audio in a window
+PARTIAL_TRANSCRIPTION_MAX_WINDOW = 30.0  # seconds, longer speech is cut anyway
+PARTIAL_TRANSCRIPTION_OVERLAP = 1.0  # seconds repeated from the previous window
+
+# Number of loaded sounds kept in memory for instant replay
+SOUND_CACHE_SIZE = 16
+
+# Number of latest user and assistant messages prefetched when opening a chat
+SOUND_PREFETCH_COUNT = 3
+
+# Number of concurrent speech-to-text requests
+TRANSCRIPTION_WORKERS = 2
+
+# Persistent cache of transcripts of audio files
+TRANSCRIPTION_CACHE_SIZE = 1000  # transcripts
+TRANSCRIPTION_CACHE_MAX_AGE = 90 * 24 * 60 * 60  # seconds since the last use
+
+# Number of concurrent chat completion requests
+COMPLETION_WORKERS = 2
+
+# Default token budget of the context of a completion request; older messages
+# not fitting into the budget are replaced by a rolling summary
+CONTEXT_TOKEN_BUDGET = 3000  # tokens
+
+# Share of the budget the messages newer than the summary may take before the
+# oldest of them are folded into the summary, and the share they're folded
+# down to; they're summarized while they still fit, so none drop out of the
+# context before they're summarized
+CONTEXT_SUMMARY_THRESHOLD = 0.75
+CONTEXT_SUMMARY_TARGET = 0.5
+
+# Persistent cache of completions of bots with the cache enabled, used only
+# at temperatures low enough for the completions to be repeatable
+COMPLETION_CACHE_SIZE = 500  # completions
+COMPLETION_CACHE_TTL = 7 * 24 * 60 * 60  # seconds since the completion
+COMPLETION_CACHE_MAX_TEMPERATURE = 0.05
+
+# Number of concurrent text-to-speech requests (sentence segments)
+SPEECH_WORKERS = 3
+
+# Shorter sentences are synthesized together with the following ones
+SPEECH_SEGMENT_MIN_LENGTH = 20  # characters
+
 
-app_dirs = [RESOURCES_DIR, AUDIO_DIR, RECORDINGS_DIR, CHATS_AUDIO_DIR]
+app_dirs = [
+    RESOURCES_DIR,
+    AUDIO_DIR,
+    RECORDINGS_DIR,
+    CHATS_AUDIO_DIR,
+    SPEECH_STORE_DIR,
+]
@@ -0,0 +1,184 @@
+"""
+Context
+=======
+
+This module contains the packing of chat messages into the context of
+a completion request within a token budget.
+
+The tokens are estimated locally by counting word pieces of at most four
+characters and punctuation marks, which follows the tokenization of
+the completion models closely enough to keep the requests within their
+budget without a tokenizer.
+
+The messages newer than the rolling summary are packed verbatim. Once they
+take most of the budget, the oldest of them are folded into the summary
+(while they're still packed, so there's no gap between the summary and the
+packed messages), so the size (and latency) of a completion request stays
+bounded however long the chat runs. The summary is anchored on the time of
+the last summarized message, so it stays valid when messages are deleted.
+
+The ConversationContext class keeps the conversation messages of a chat in
+the API format with their token estimates, so they're appended as they're
+sent instead of being rebuilt from the database on every turn.
+
+Example usage:
+    conversation_context = ConversationContext()
+    conversation_context.append(("user", 1), user_message_dict, sent_at)
+
+    summary = "The user introduced themselves as Alice."
+    summary_start = get_summary_start(
+        summary, conversation_context.count_until(summarized_until)
+    )
+    context_messages, summary_end = pack_messages(
+        [{"role": "system", "content": "You are a helpful assistant."}],
+        conversation_context.messages,
+        budget=3000,
+        summary=summary,
+        summary_start=summary_start,
+    )
+    messages_to_summarize = conversation_context.messages[summary_start:summary_end]
+"""
+
+import re
+from bisect import bisect_right
+
+from alkvin.config import CONTEXT_SUMMARY_TARGET, CONTEXT_SUMMARY_THRESHOLD
+
+
+# Word pieces (up to 4 characters long) and punctuation marks
+_TOKEN_PIECE = re.compile(r"\w{1,4}|[^\w\s]")
+
+# Tokens of the role and delimiters of every message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text):
+    """Return an estimate of the token count of the text."""
+
+    return len(_TOKEN_PIECE.findall(text))
+
+
+def estimate_message_tokens(message):
+    return MESSAGE_OVERHEAD_TOKENS + estimate_tokens(message["content"])
+
+
+def get_summary_message(summary):
+    return {
+        "role": "system",
+        "content": f"Summary of the earlier conversation:\n{summary}",
+    }
+
+
+def get_summary_start(summary, summary_start):
+    """Return the index of the first message not represented by the summary
+    (an empty summary represents no messages)."""
+
+    return summary_start if summary else 0
+
+
+class ConversationContext:
+    """Incrementally maintained conversation messages in the API format.
+
+    Every message is identified by a key (e.g. its model and id), so the
+    context can tell whether a saved message is new or edited.
+    """
+
+    def __init__(self):
+        self.messages = []
+        self.message_tokens = []
+        self.message_times = []
+
+        self._message_indices = {}  # key -> index of the message
+        self._last_time = None
+
+    def __contains__(self, key):
+        return key in self._message_indices
+
+    def get(self, key):
+        return self.messages[self._message_indices[key]]
+
+    def append(self, key, message, time):
+        """Append the message sent at the time.
+
+        Returns False if the message would be out of order, i.e. it was sent
+        before the last message, so the context needs to be rebuilt.
+        """
+
+        if self._last_time is not None and time < self._last_time:
+            return False
+
+        self._message_indices[key] = len(self.messages)
+        self.messages.append(message)
+        self.message_tokens.append(estimate_message_tokens(message))
+        self.message_times.append(time)
+        self._last_time = time
+
+        return True
+
+    def count_until(self, time):
+        """Return the count of the messages sent at or before the time."""
+
+        if time is None:
+            return 0
+
+        return bisect_right(self.message_times, time)
+
+
+def pack_messages(
+    prompt_messages,
+    messages,
+    budget,
+    summary="",
+    summary_start=0,
+    message_tokens=None,
+    summary_threshold=CONTEXT_SUMMARY_THRESHOLD,
+    summary_target=CONTEXT_SUMMARY_TARGET,
+):
+    """Pack the prompt messages, the summary and the messages newer than the
+    summary into the token budget.
+
+    The messages before `summary_start` are represented by the summary, so
+    they're never packed verbatim. If the newer messages don't fit into the
+    budget (i.e. the summary lags behind), they're trimmed from the oldest
+    one; the newest message is always packed, even if it doesn't fit. Token
+    estimates of the messages can be passed precomputed in `message_tokens`.
+
+    Returns the packed messages and the end index of the messages to fold
+    into the summary: the oldest ones trimmed or taking the newer messages
+    over the `summary_threshold` share of their budget, down to the
+    `summary_target` share (the newest message is never summarized).
+    """
+
+    packed_messages = list(prompt_messages)
+    if summary:
+        packed_messages.append(get_summary_message(summary))
+    summary_start = get_summary_start(summary, summary_start)
+
+    if message_tokens is None:
+        message_tokens = [estimate_message_tokens(message) for message in messages]
+
+    messages_budget = budget - sum(
+        estimate_message_tokens(message) for message in packed_messages
+    )
+
+    first_packed_index = len(messages)
+    remaining_budget = messages_budget
+    while first_packed_index > summary_start:
+        tokens = message_tokens[first_packed_index - 1]
+        if tokens > remaining_budget and first_packed_index < len(messages):
+            break
+
+        remaining_budget -= tokens
+        first_packed_index -= 1
+
+    summary_end = summary_start
+    tokens = sum(message_tokens[summary_start:])
+    if tokens > messages_budget * summary_threshold:
+        while summary_end < len(messages) - 1 and (
+            tokens > messages_budget * summary_target
+            or summary_end < first_packed_index
+        ):
+            tokens -= message_tokens[summary_end]
+            summary_end += 1
+
+    return packed_messages + messages[first_packed_index:], summary_end
@@ -4,14 +4,35 @@ DB
 
 This module contains the database configuration and the base model for the
 application.
+
+The database connections are configured by the pragmas in `DB_PRAGMAS`
+(write-ahead logging, cache sizes, enforced foreign keys, ...).
+
+The CacheModel class is the base of the persistent caches of results of API
+requests (e.g. transcripts and completions).
 """
 
-from datetime import datetime
+import hashlib
+import json
+from datetime import datetime, timedelta
+
+from peewee import CharField, DateTimeField, Model, SqliteDatabase, TextField
+from playhouse.migrate import SqliteMigrator, migrate
+
+from alkvin.config import DB_PATH, DB_PRAGMAS
+
 
-from peewee import DateTimeField, Model, SqliteDatabase
+db = SqliteDatabase(str(DB_PATH), pragmas=DB_PRAGMAS)
 
 
-db = SqliteDatabase("resources/alkvin.db")
+class JSONField(TextField):
+    """Text field storing JSON serializable values."""
+
+    def db_value(self, value):
+        return None if value is None else json.dumps(value)
+
+    def python_value(self, value):
+        return None if value is None else json.loads(value)
 
 
 class BaseModel(Model):
@@ -25,3 +46,109 @@ class BaseModel(Model):
     class Meta:
         database = db
         legacy_table_names = False
+
+
+class CacheModel(BaseModel):
+    """Base model of caches of values addressed by a hash of their request.
+
+    The subclasses define the field of the cached values, named by
+    `cache_value_field`, the size of the cache, and the time to live of the
+    values (in seconds) since they were stored, or since they were last used
+    if `cache_ttl_since_use` is set. The least recently used values are
+    evicted when the cache grows over its size.
+    """
+
+    key = CharField(unique=True)
+    accessed_at = DateTimeField(default=datetime.now, index=True)
+
+    cache_value_field = None
+    cache_size = None
+    cache_ttl = None
+    cache_ttl_since_use = False
+
+    @classmethod
+    def get_key(cls, *key_values, key_hash=None):
+        """Return the hash of the canonical JSON of the key values, added to
+        the `key_hash` if given (e.g. with hashed file content)."""
+
+        if key_hash is None:
+            key_hash = hashlib.sha256()
+
+        canonical_json = json.dumps(
+            key_values, sort_keys=True, separators=(",", ":"), ensure_ascii=False
+        )
+        key_hash.update(canonical_json.encode())
+
+        return key_hash.hexdigest()
+
+    @classmethod
+    def _get_expiry_condition(cls):
+        expiry_field = cls.accessed_at if cls.cache_ttl_since_use else cls.created_at
+
+        return expiry_field < datetime.now() - timedelta(seconds=cls.cache_ttl)
+
+    @classmethod
+    def lookup(cls, key):
+        """Return the cached value, or None if it isn't cached (or it's
+        expired)."""
+
+        cached = cls.get_or_none((cls.key == key) & ~cls._get_expiry_condition())
+        if cached is None:
+            return None
+
+        cls.update(accessed_at=datetime.now()).where(cls.key == key).execute()
+
+        return getattr(cached, cls.cache_value_field)
+
+    @classmethod
+    def store(cls, key, value):
+        cls.insert(
+            {cls.key: key, getattr(cls, cls.cache_value_field): value}
+        ).on_conflict_replace().execute()
+
+        cls.evict()
+
+    @classmethod
+    def evict(cls):
+        """Delete the expired values and the least recently used ones over
+        the size of the cache."""
+
+        cls.delete().where(cls._get_expiry_condition()).execute()
+
+        kept_values = (
+            cls.select(cls.id).order_by(cls.accessed_at.desc()).limit(cls.cache_size)
+        )
+        cls.delete().where(cls.id.not_in(kept_values)).execute()
+
+
+def migrate_tables(models):
+    """Add columns of model fields missing in the existing tables.
+
+    Tables created by an older version of the application lack columns of
+    the fields introduced later, which all have a default value or are
+    nullable, so they can be simply added.
+
+    Adding a column with a constraint rebuilds the table, which fails on
+    the references of the other tables while foreign keys are enforced, so
+    they're enforced again only after the migrations. The existing rows are
+    expected to satisfy the foreign keys.
+    """
+
+    migrator = SqliteMigrator(db)
+
+    db.pragma("foreign_keys", "OFF")
+    try:
+        for model in models:
+            table_name = model._meta.table_name
+            column_names = {column.name for column in db.get_columns(table_name)}
+
+            operations = [
+                migrator.add_column(table_name, field.column_name, field)
+                for field in model._meta.sorted_fields
+                if field.column_name not in column_names
+            ]
+            if operations:
+                with db.atomic():
+                    migrate(*operations)
+    finally:
+        db.pragma("foreign_keys", DB_PRAGMAS["foreign_keys"])
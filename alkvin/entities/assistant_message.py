@@ -9,34 +9,109 @@ Example usage:
     message = AssistantMessage.create(chat=chat, completion="This is a completion.")
 """
 
-import os
 from datetime import datetime
 
 from peewee import CharField, DateTimeField, ForeignKeyField
 
-from alkvin.db import BaseModel
+from alkvin.db import BaseModel, JSONField
 
 from alkvin.entities.chat import Chat
+from alkvin.entities.speech_blob import SpeechBlob
 
 
 class AssistantMessage(BaseModel):
     """AssistantMessage model class for chat assistant messages."""
 
-    chat = ForeignKeyField(Chat, backref="assistant_messages")
+    chat = ForeignKeyField(Chat, backref="assistant_messages", on_delete="CASCADE")
 
     completion = CharField(default="")
+    completion_requested_at = DateTimeField(null=True)
+    completion_first_token_at = DateTimeField(null=True)
     completion_received_at = DateTimeField(null=True)
 
     speech_file = CharField(null=True)
+    speech_requested_at = DateTimeField(null=True)
+    speech_first_chunk_at = DateTimeField(null=True)
     speech_received_at = DateTimeField(null=True)
 
+    playback_started_at = DateTimeField(null=True)
+
+    # Index of the sentence segments of the speech,
+    # [{"text": sentence, "duration": seconds}, ...]
+    speech_segments = JSONField(default=list)
+
     @property
     def speech_path(self):
         if self.speech_file is None:
             return None
 
-        return os.path.join(self.chat.audio_dir, self.speech_file)
+        return SpeechBlob.get_path(self.speech_file)
+
+    @property
+    def speech_files(self):
+        """Files of the speech store referenced by the message."""
+
+        # Segments synthesized by older versions were stored in files too
+        speech_files = [
+            segment["file"] for segment in self.speech_segments if "file" in segment
+        ]
+        if self.speech_file is not None:
+            speech_files.append(self.speech_file)
+
+        return speech_files
+
+    @property
+    def context_entry(self):
+        """Key, API format and time of the message in the conversation
+        context."""
+
+        return (
+            ("assistant", self.id),
+            {"role": "assistant", "content": self.completion},
+            self.completion_received_at,
+        )
+
+    def set_speech(self, speech_file, speech_segments):
+        """Set the speech files of the message (unsaved) and update their
+        references in the speech store."""
+
+        old_speech_files = self.speech_files
+
+        self.speech_file = speech_file
+        self.speech_segments = speech_segments
+
+        # The new files are acquired first, so the files shared with the old
+        # ones aren't removed
+        for speech_file in self.speech_files:
+            SpeechBlob.acquire(speech_file)
+        SpeechBlob.release(*old_speech_files)
 
     @classmethod
     def create(cls, *args, **kwargs):
         return super().create(*args, completion_received_at=datetime.now(), **kwargs)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+
+        if self.completion_received_at is not None:
+            Chat.update_context(self.chat_id, *self.context_entry)
+        else:
+            Chat.remove_from_context(self.chat_id, ("assistant", self.id))
+
+    def delete_instance(self, *args, **kwargs):
+        Chat.remove_from_context(self.chat_id, ("assistant", self.id))
+
+        SpeechBlob.release(*self.speech_files)
+
+        return super().delete_instance(*args, **kwargs)
+
+
+# Ordering of the chat messages, see `Chat.select_timeline`
+AssistantMessage.add_index(
+    AssistantMessage.index(
+        AssistantMessage.chat,
+        AssistantMessage.completion_received_at.is_null(False),
+        AssistantMessage.completion_received_at,
+        name="assistant_message_timeline",
+    )
+)
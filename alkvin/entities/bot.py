@@ -9,16 +9,21 @@ Example usage:
     bot = Bot.create(name="My Bot")
 """
 
-from datetime import datetime
+import re
 from uuid import uuid4
 
-from peewee import CharField, FloatField
+from peewee import BooleanField, CharField, FloatField, IntegerField
 
-from alkvin.db import BaseModel
+from alkvin.db import BaseModel, db
+
+from alkvin.audio.profiles import DEFAULT_RECORDING_PROFILE, RECORDING_PROFILES
+from alkvin.config import COMPLETION_CACHE_MAX_TEMPERATURE, CONTEXT_TOKEN_BUDGET
 
 
 SPEECH_VOICES = ("alloy", "echo", "fable", "onyx", "nova", "shimmer")
 
+SPEECH_FRAME_RATE = 24000  # Hz
+
 
 class Bot(BaseModel):
     """Bot model class for chat bots."""
@@ -31,14 +36,25 @@ class Bot(BaseModel):
 
     completion_prompt = CharField(default="")
     completion_temperature = FloatField(default=1.0)
+    completion_cache_enabled = BooleanField(default=False)
+    context_token_budget = IntegerField(default=CONTEXT_TOKEN_BUDGET)
 
     summarization_prompt = CharField(default="")
 
     speech_voice = CharField(default=SPEECH_VOICES[0])
 
+    recording_profile = CharField(default=DEFAULT_RECORDING_PROFILE)
+
     def get_speech_voices():
         return SPEECH_VOICES
 
+    def get_recording_profiles():
+        return tuple(RECORDING_PROFILES)
+
+    @classmethod
+    def select_names(cls):
+        return cls.select(cls.id, cls.name).order_by(cls.name)
+
     def new():
         return Bot.create(name=f"NEW BOT [{uuid4().hex[:8]}]")
 
@@ -52,10 +68,31 @@ class Bot(BaseModel):
             transcription_temperature=self.transcription_temperature,
             completion_prompt=self.completion_prompt,
             completion_temperature=self.completion_temperature,
+            completion_cache_enabled=self.completion_cache_enabled,
+            context_token_budget=self.context_token_budget,
             summarization_prompt=self.summarization_prompt,
             speech_voice=self.speech_voice,
+            recording_profile=self.recording_profile,
         )
 
+    @property
+    def caches_completions(self):
+        """True if the completions are cached, which requires the cache to be
+        enabled and the completions to be (nearly) deterministic."""
+
+        return (
+            self.completion_cache_enabled
+            and self.completion_temperature <= COMPLETION_CACHE_MAX_TEMPERATURE
+        )
+
+    def delete_instance(self, *args, **kwargs):
+        """Delete the bot, leaving its chats without a bot."""
+
+        with db.atomic():
+            return super().delete_instance(
+                *args, recursive=True, delete_nullable=False, **kwargs
+            )
+
     def get_taken_names(self):
         return [bot.name for bot in Bot.select().where(Bot.name != self.name)]
 
@@ -72,11 +109,9 @@ class Bot(BaseModel):
         )
         return transcript
 
-    def chat_complete(self, chat, on_completion_callback):
-        """Create a completion based on the bot's prompts and
-        the previous chat messages."""
-
-        messages = chat.messages_to_complete
+    def stream_completion(self, messages):
+        """Create a completion of the chat messages packed with the bot's
+        prompts and yield it in chunks (token deltas) as they're generated."""
 
         from random import choice
 
@@ -89,7 +124,32 @@ class Bot(BaseModel):
             ]
         )
 
-        on_completion_callback(completion)
+        for delta in re.findall(r"\S+\s*", completion):
+            yield delta
+
+    def summarize_messages(self, summary, messages):
+        """Create a summary of the chat messages (in the API format) with
+        the bot's summarization prompt, continuing the summary of the earlier
+        messages."""
+
+        from random import choice
+
+        return choice(
+            [
+                "This is a summary.",
+                "This is another summary.",
+                "This is yet another summary.",
+                "This is the final summary.",
+            ]
+        )
+
+    def stream_speech(self, text):
+        """Synthesize speech of the text with the bot's voice and yield it in
+        chunks of 16-bit mono PCM audio (at SPEECH_FRAME_RATE) as they're
+        generated."""
+
+        chunk_frame_count = SPEECH_FRAME_RATE // 10
+        frame_count = int(len(text) * 0.06 * SPEECH_FRAME_RATE)
 
-    def synthesize_speech(self, completion):
-        return f"user_{datetime.now().isoformat()}.opus"
+        for _ in range(0, frame_count, chunk_frame_count):
+            yield bytes(2 * chunk_frame_count)
@@ -0,0 +1,38 @@
+"""
+Cached Completion
+=================
+
+This module defines the CachedCompletion model class, which is used to store
+completions of deterministic (zero or near zero temperature) bots in the
+database, so the same conversation completed with the same settings (e.g. a
+recreated reply or a replicated bot) doesn't need a new completion request.
+
+The completions are addressed by a hash of the canonical JSON of the chat
+messages and the model parameters. The least recently used completions are
+evicted when the cache grows over its size, and all completions once they get
+older than the time to live, so a changed model behind the API gets a chance
+to answer again (see `CacheModel`).
+
+Example usage:
+    key = CachedCompletion.get_key(chat.messages_to_complete, 0.0)
+    completion = CachedCompletion.lookup(key)
+    if completion is None:
+        completion = "".join(bot.stream_completion(chat.messages_to_complete))
+        CachedCompletion.store(key, completion)
+"""
+
+from peewee import TextField
+
+from alkvin.db import CacheModel
+
+from alkvin.config import COMPLETION_CACHE_SIZE, COMPLETION_CACHE_TTL
+
+
+class CachedCompletion(CacheModel):
+    """CachedCompletion model class for completions of chat messages."""
+
+    completion = TextField()
+
+    cache_value_field = "completion"
+    cache_size = COMPLETION_CACHE_SIZE
+    cache_ttl = COMPLETION_CACHE_TTL
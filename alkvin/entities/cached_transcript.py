@@ -0,0 +1,52 @@
+"""
+Cached Transcript
+=================
+
+This module defines the CachedTranscript model class, which is used to store
+transcripts of audio files in the database, so the same audio transcribed
+with the same settings (e.g. of a recreated message or by a replicated bot)
+doesn't need a new speech-to-text request.
+
+The transcripts are addressed by a hash of the audio content and of the
+transcription settings. The least recently used transcripts are evicted when
+the cache grows over its size, and unused transcripts when they get too old
+(see `CacheModel`).
+
+Example usage:
+    key = CachedTranscript.get_key("message.opus", "en", "", 0.0)
+    transcript = CachedTranscript.lookup(key)
+    if transcript is None:
+        transcript = bot.transcribe_audio("message.opus")
+        CachedTranscript.store(key, transcript)
+"""
+
+import hashlib
+
+from peewee import TextField
+
+from alkvin.db import CacheModel
+
+from alkvin.config import TRANSCRIPTION_CACHE_MAX_AGE, TRANSCRIPTION_CACHE_SIZE
+
+
+class CachedTranscript(CacheModel):
+    """CachedTranscript model class for transcripts of audio files."""
+
+    transcript = TextField()
+
+    cache_value_field = "transcript"
+    cache_size = TRANSCRIPTION_CACHE_SIZE
+    cache_ttl = TRANSCRIPTION_CACHE_MAX_AGE
+    cache_ttl_since_use = True
+
+    @classmethod
+    def get_key(cls, audio_path, language, prompt, temperature):
+        """Return the hash of the audio file content and transcription settings."""
+
+        key_hash = hashlib.sha256()
+
+        with open(audio_path, "rb") as audio_file:
+            for block in iter(lambda: audio_file.read(1024 * 1024), b""):
+                key_hash.update(block)
+
+        return super().get_key(language, prompt, temperature, key_hash=key_hash)
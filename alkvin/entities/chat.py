@@ -10,17 +10,37 @@ Example usage:
 """
 
 import os
-import shutil
+from itertools import islice
 from uuid import uuid4
 
-from peewee import CharField, ForeignKeyField
+from peewee import (
+    JOIN,
+    SQL,
+    CharField,
+    DateTimeField,
+    ForeignKeyField,
+    TextField,
+    Value,
+    fn,
+)
 
 from alkvin.entities.user import User
 from alkvin.entities.bot import Bot
 
-from alkvin.db import BaseModel
+from alkvin.db import BaseModel, db
+
+from alkvin.context import ConversationContext, get_summary_start, pack_messages
 
 from alkvin.config import CHATS_AUDIO_DIR
+from alkvin.janitor import get_janitor
+
+
+# Messages loaded by a single query when iterating over the chat messages
+_MESSAGES_BATCH_SIZE = 100
+
+# Conversation contexts of the chats by chat id, built on the first use and
+# updated when messages are saved or deleted
+_conversation_contexts = {}
 
 
 class Chat(BaseModel):
@@ -32,57 +52,206 @@ class Chat(BaseModel):
     user = ForeignKeyField(User, backref="chats", null=True)
     bot = ForeignKeyField(Bot, backref="chats", null=True)
 
+    # Rolling summary of the conversation messages sent until (and at)
+    # `context_summarized_until`, which replaces them in the context of
+    # completion requests
+    context_summary = TextField(default="")
+    context_summarized_until = DateTimeField(null=True)
+
+    class Meta:
+        indexes = ((("updated_at",), False),)
+
+    @classmethod
+    def select_recent(cls):
+        """Select the listed fields of all chats, the last updated first."""
+
+        return cls.select(cls.id, cls.title, cls.summary).order_by(
+            cls.updated_at.desc()
+        )
+
+    def select_timeline(self, limit=None, offset=None):
+        """Select the kinds, ids and sorting keys of messages in the chat,
+        sorted by sent time (see `iter_messages`).
+
+        The ordering is served by the timeline indexes of both message tables,
+        which are merged without sorting.
+        """
+
+        from .user_message import UserMessage
+        from .assistant_message import AssistantMessage
+
+        user_timeline = UserMessage.select(
+            Value("user").alias("kind"),
+            UserMessage.id,
+            UserMessage.sent_at.is_null(False).alias("is_sent"),
+            fn.COALESCE(UserMessage.sent_at, UserMessage.audio_created_at).alias(
+                "sort_time"
+            ),
+        ).where(UserMessage.chat == self.id)
+        assistant_timeline = AssistantMessage.select(
+            Value("assistant").alias("kind"),
+            AssistantMessage.id,
+            # Always true, but matching the index expression
+            AssistantMessage.completion_received_at.is_null(False).alias("is_sent"),
+            AssistantMessage.completion_received_at.alias("sort_time"),
+        ).where(AssistantMessage.chat == self.id)
+
+        return (
+            user_timeline.union_all(assistant_timeline)
+            .order_by(SQL("is_sent"), SQL("sort_time"))
+            .limit(limit)
+            .offset(offset)
+            .tuples()
+        )
+
+    def iter_messages(self, limit=None, offset=None):
+        """Iterate over messages in the chat, sorted by sent time.
+
+        The unsent user messages come first, sorted by their audio creation
+        time, followed by the sent user and assistant messages. The messages
+        are ordered by a single query over both message tables, and loaded
+        lazily in batches, with the chat bound to them.
+        """
+
+        from .user_message import UserMessage
+        from .assistant_message import AssistantMessage
+
+        models = {"user": UserMessage, "assistant": AssistantMessage}
+
+        timeline_rows = iter(self.select_timeline(limit, offset))
+        while True:
+            batch = list(islice(timeline_rows, _MESSAGES_BATCH_SIZE))
+            if not batch:
+                break
+
+            loaded_messages = {}
+            for kind, model in models.items():
+                ids = [row[1] for row in batch if row[0] == kind]
+                if ids:
+                    for message in model.select().where(model.id.in_(ids)):
+                        message.chat = self
+                        loaded_messages[(kind, message.id)] = message
+
+            for row in batch:
+                yield loaded_messages[(row[0], row[1])]
+
     @property
     def messages(self):
         """Get all messages in the chat, sorted by sent time."""
 
-        def messages_sorting_key(message):
-            from .user_message import UserMessage
-            from .assistant_message import AssistantMessage
+        return list(self.iter_messages())
+
+    @staticmethod
+    def get_audio_dir(chat_id):
+        return os.path.join(CHATS_AUDIO_DIR, str(chat_id))
 
-            is_sent_message = (
-                isinstance(message, UserMessage) and message.sent_at is not None
-            ) or isinstance(message, AssistantMessage)
+    @property
+    def audio_dir(self):
+        return Chat.get_audio_dir(self.id)
 
-            if isinstance(message, UserMessage):
-                sorting_time = (
-                    message.sent_at
-                    if message.sent_at is not None
-                    else message.audio_created_at
-                )
-            elif isinstance(message, AssistantMessage):
-                sorting_time = message.completion_received_at
+    @property
+    def conversation_context(self):
+        """Sent messages of the conversation in the API format (see
+        `ConversationContext`), loaded from the database only once."""
 
-            return (is_sent_message, sorting_time)
+        from .user_message import UserMessage
 
-        return sorted(
-            list(self.user_messages) + list(self.assistant_messages),
-            key=messages_sorting_key,
-        )
+        conversation_context = _conversation_contexts.get(self.id)
+        if conversation_context is not None:
+            return conversation_context
+
+        conversation_context = ConversationContext()
+        for message in self.messages:
+            if not isinstance(message, UserMessage) or message.sent_at is not None:
+                conversation_context.append(*message.context_entry)
+
+        _conversation_contexts[self.id] = conversation_context
+
+        return conversation_context
 
     @property
-    def audio_dir(self):
-        return os.path.join(CHATS_AUDIO_DIR, str(self.id))
+    def conversation_messages(self):
+        return self.conversation_context.messages
+
+    @staticmethod
+    def update_context(chat_id, key, message, time):
+        """Append the saved message to the cached conversation context of
+        the chat, or drop the context if the message is edited or out of
+        order."""
+
+        conversation_context = _conversation_contexts.get(chat_id)
+        if conversation_context is None:
+            return
+
+        if key in conversation_context:
+            if conversation_context.get(key) != message:
+                del _conversation_contexts[chat_id]
+        elif not conversation_context.append(key, message, time):
+            del _conversation_contexts[chat_id]
+
+    @staticmethod
+    def remove_from_context(chat_id, key):
+        """Drop the cached conversation context of the chat if it contains
+        the (deleted or unsent) message."""
+
+        conversation_context = _conversation_contexts.get(chat_id)
+        if conversation_context is not None and key in conversation_context:
+            del _conversation_contexts[chat_id]
+
+    def pack_context(self):
+        """Pack the prompts, the context summary and the newest conversation
+        messages within the bot's token budget.
+
+        Returns the packed messages in the API format, the messages to fold
+        into the context summary and the time of the last of them.
+        """
+
+        bot, user = self.bot, self.user
+
+        prompt_messages = [{"role": "system", "content": bot.completion_prompt}]
+
+        if user.introduction:
+            prompt_messages.append({"role": "user", "content": user.introduction})
+
+        conversation_context = self.conversation_context
+        summary_start = get_summary_start(
+            self.context_summary,
+            conversation_context.count_until(self.context_summarized_until),
+        )
+        packed_messages, summary_end = pack_messages(
+            prompt_messages,
+            conversation_context.messages,
+            bot.context_token_budget,
+            self.context_summary,
+            summary_start,
+            conversation_context.message_tokens,
+        )
+
+        messages_to_summarize = conversation_context.messages[summary_start:summary_end]
+        summarized_until = (
+            conversation_context.message_times[summary_end - 1]
+            if messages_to_summarize
+            else self.context_summarized_until
+        )
+
+        return packed_messages, messages_to_summarize, summarized_until
 
     @property
     def messages_to_complete(self):
         """Conversation messages and prompts packed in the API format."""
 
-        from .user_message import UserMessage
-        from .assistant_message import AssistantMessage
+        return self.pack_context()[0]
 
-        messages = [{"role": "system", "content": self.bot.completion_prompt}]
+    def set_context_summary(self, summary, summarized_until):
+        """Store the rolling summary of the conversation messages sent until
+        `summarized_until` (without saving the other fields of the chat)."""
 
-        if self.user.introduction:
-            messages.append({"role": "user", "content": self.user.introduction})
+        self.context_summary = summary
+        self.context_summarized_until = summarized_until
 
-        for message in self.messages:
-            if isinstance(message, UserMessage) and message.sent_at is not None:
-                messages.append({"role": "user", "content": message.transcript})
-            elif isinstance(message, AssistantMessage):
-                messages.append({"role": "assistant", "content": message.completion})
-
-        return messages
+        Chat.update(
+            context_summary=summary, context_summarized_until=summarized_until
+        ).where(Chat.id == self.id).execute()
 
     @classmethod
     def create(cls, *args, **kwargs):
@@ -90,6 +259,22 @@ class Chat(BaseModel):
         os.makedirs(chat.audio_dir)
         return chat
 
+    @classmethod
+    def select_with_participants(cls, chat_id):
+        return (
+            cls.select(cls, User, Bot)
+            .join(User, JOIN.LEFT_OUTER)
+            .switch(cls)
+            .join(Bot, JOIN.LEFT_OUTER)
+            .where(cls.id == chat_id)
+        )
+
+    @classmethod
+    def get_with_participants(cls, chat_id):
+        """Get the chat with its user and bot loaded by the same query."""
+
+        return cls.select_with_participants(chat_id).get()
+
     @classmethod
     def new(cls):
         new_chat_title = f"NEW CHAT [{uuid4().hex[:8]}]"
@@ -98,15 +283,51 @@ class Chat(BaseModel):
         )
         return cls.create(title=new_chat_title, summary=new_chat_summary)
 
+    @staticmethod
+    def remove_deleted_audio_dirs():
+        """Remove audio directories of deleted chats, which the janitor
+        didn't manage to remove before the application exited."""
+
+        for dir_name in os.listdir(CHATS_AUDIO_DIR):
+            if ".deleted-" in dir_name:
+                get_janitor().remove_tree(os.path.join(CHATS_AUDIO_DIR, dir_name))
+
     def delete_instance(self, *args, **kwargs):
-        """Delete the chat instance and all its messages and audio files."""
+        """Delete the chat instance and all its messages and audio files.
+
+        The messages are deleted in bulk, in the same transaction as the chat
+        (tables created by older versions lack the cascading foreign keys),
+        and the audio directory is removed in the background by the janitor.
+        """
+
+        from .user_message import UserMessage
+        from .assistant_message import AssistantMessage
+        from .speech_blob import SpeechBlob
+
+        speech_files = [
+            speech_file
+            for assistant_message in AssistantMessage.select(
+                AssistantMessage.speech_file, AssistantMessage.speech_segments
+            ).where(AssistantMessage.chat == self.id)
+            for speech_file in assistant_message.speech_files
+        ]
+
+        with db.atomic():
+            UserMessage.delete().where(UserMessage.chat == self.id).execute()
+            AssistantMessage.delete().where(
+                AssistantMessage.chat == self.id
+            ).execute()
+
+            deleted_count = super().delete_instance(*args, **kwargs)
+
+        SpeechBlob.release(*speech_files)
 
-        for user_message in self.user_messages:
-            user_message.delete_instance()
-        for assistant_message in self.assistant_messages:
-            assistant_message.delete_instance()
+        _conversation_contexts.pop(self.id, None)
 
-        chat_audio_dir = os.path.join(CHATS_AUDIO_DIR, str(self.id))
-        shutil.rmtree(chat_audio_dir)
+        # Renamed first, so a new chat reusing the id gets a fresh directory
+        if os.path.exists(self.audio_dir):
+            deleted_audio_dir = f"{self.audio_dir}.deleted-{uuid4().hex[:8]}"
+            os.rename(self.audio_dir, deleted_audio_dir)
+            get_janitor().remove_tree(deleted_audio_dir)
 
-        return super().delete_instance(*args, **kwargs)
+        return deleted_count
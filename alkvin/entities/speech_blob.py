@@ -0,0 +1,186 @@
+"""
+Speech Blob
+===========
+
+This module defines the SpeechBlob model class, which is used to count
+references to the synthesized speech files in the speech store.
+
+The speech store is a directory shared by all chats, where the speech files
+are addressed by a hash of the text, voice and format of the speech, so
+identical texts (e.g. greetings or answers of replicated bots) are stored
+only once. A speech file is removed (in the janitor thread) when the last
+message referencing it is deleted, unless it's pinned by a running synthesis,
+which is going to use it.
+
+Example usage:
+    speech_file = SpeechBlob.get_file("Hello!", "alloy")
+    if not os.path.exists(SpeechBlob.get_path(speech_file)):
+        synthesize_speech("Hello!", SpeechBlob.get_path(speech_file))
+    SpeechBlob.acquire(speech_file)
+    ...
+    SpeechBlob.release(speech_file)
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import Counter
+
+from peewee import CharField, IntegerField, chunked
+
+from alkvin.db import BaseModel, db
+
+from alkvin.audio.peaks import PEAKS_EXTENSION, remove_peaks
+from alkvin.audio.profiles import RecordingProfile
+from alkvin.config import SPEECH_STORE_DIR
+from alkvin.janitor import get_janitor
+
+from alkvin.entities.bot import SPEECH_FRAME_RATE
+
+
+# Storage format of the speech files, which are synthesized as mono PCM
+SPEECH_STORE_PROFILE = RecordingProfile(
+    SPEECH_FRAME_RATE, 1, "opus", "libopus", "32k", "opus"
+)
+
+# Files in a single query, within the SQLite limit of query parameters
+_FILES_BATCH_SIZE = 500
+
+# Files used by running speech syntheses (before any message references
+# them) by the counts of their uses
+_pinned_files = Counter()
+
+# Serializes pinning of files with removal of unreferenced files, so a file
+# can't be removed between being pinned and being used; it's held only for
+# in-memory checks and file removals, never for database queries
+_store_lock = threading.Lock()
+
+
+class SpeechBlob(BaseModel):
+    """SpeechBlob model class for reference counts of stored speech files."""
+
+    file = CharField(unique=True)
+    ref_count = IntegerField(default=0)
+
+    @staticmethod
+    def get_file(text, voice, speech_format=SPEECH_STORE_PROFILE.extension):
+        """Return the name of the speech file of the text in the store."""
+
+        key = hashlib.sha256(
+            json.dumps([text, voice, speech_format]).encode()
+        ).hexdigest()
+
+        return f"{key}.{speech_format}"
+
+    @staticmethod
+    def get_path(speech_file):
+        return os.path.join(SPEECH_STORE_DIR, speech_file)
+
+    @classmethod
+    def acquire(cls, speech_file):
+        cls.insert(file=speech_file, ref_count=1).on_conflict(
+            conflict_target=[cls.file],
+            update={cls.ref_count: cls.ref_count + 1},
+        ).execute()
+
+    @staticmethod
+    def pin(speech_file):
+        """Keep the speech file in the store while it's used (e.g. streamed
+        or joined by a running synthesis), even if no message references it."""
+
+        with _store_lock:
+            _pinned_files[speech_file] += 1
+
+    @classmethod
+    def unpin(cls, *speech_files):
+        """Unpin the speech files, removing the files which aren't pinned or
+        referenced anymore (e.g. of a failed or cancelled synthesis)."""
+
+        with _store_lock:
+            _pinned_files.subtract(speech_files)
+
+            unpinned_files = [
+                speech_file
+                for speech_file in set(speech_files)
+                if _pinned_files[speech_file] <= 0
+            ]
+            for speech_file in unpinned_files:
+                del _pinned_files[speech_file]
+
+        if unpinned_files:
+            get_janitor().submit(cls._remove_unreferenced, unpinned_files)
+
+    @classmethod
+    def release(cls, *speech_files):
+        """Release references to the speech files (one per occurrence),
+        removing the files which aren't referenced anymore."""
+
+        release_counts = Counter(speech_files)
+        unreferenced_files = []
+
+        with db.atomic():
+            for speech_file, release_count in release_counts.items():
+                cls.update(ref_count=cls.ref_count - release_count).where(
+                    cls.file == speech_file
+                ).execute()
+
+            for files in chunked(release_counts, _FILES_BATCH_SIZE):
+                is_unreferenced = cls.file.in_(files) & (cls.ref_count <= 0)
+                unreferenced_files += [
+                    speech_blob.file
+                    for speech_blob in cls.select(cls.file).where(is_unreferenced)
+                ]
+                cls.delete().where(is_unreferenced).execute()
+
+        if unreferenced_files:
+            get_janitor().submit(cls._remove_unreferenced, unreferenced_files)
+
+    @classmethod
+    def _remove_unreferenced(cls, speech_files):
+        """Remove the speech files, unless they've been referenced or pinned
+        again."""
+
+        for files in chunked(speech_files, _FILES_BATCH_SIZE):
+            with _store_lock:
+                candidate_files = [
+                    speech_file
+                    for speech_file in files
+                    if not _pinned_files[speech_file]
+                ]
+
+            referenced_files = {
+                speech_blob.file
+                for speech_blob in cls.select(cls.file).where(
+                    cls.file.in_(candidate_files)
+                )
+            }
+
+            # A file referenced after the query is pinned first (a message
+            # references only files of a synthesis), so rechecking the pins
+            # is enough
+            with _store_lock:
+                for speech_file in candidate_files:
+                    if speech_file in referenced_files or _pinned_files[speech_file]:
+                        continue
+
+                    speech_path = cls.get_path(speech_file)
+                    if os.path.exists(speech_path):
+                        os.remove(speech_path)
+                    remove_peaks(speech_path)
+
+    @classmethod
+    def remove_unreferenced_files(cls):
+        """Remove files of the store left by speech syntheses of messages,
+        which were never saved (e.g. cancelled)."""
+
+        referenced_files = {speech_blob.file for speech_blob in cls.select(cls.file)}
+
+        for file_name in os.listdir(SPEECH_STORE_DIR):
+            speech_file = (
+                file_name[: -len(PEAKS_EXTENSION)]
+                if file_name.endswith(PEAKS_EXTENSION)
+                else file_name
+            )
+            if speech_file not in referenced_files:
+                os.remove(cls.get_path(file_name))
@@ -13,7 +13,7 @@ from uuid import uuid4
 
 from peewee import CharField
 
-from alkvin.db import BaseModel
+from alkvin.db import BaseModel, db
 
 
 class User(BaseModel):
@@ -22,6 +22,10 @@ class User(BaseModel):
     name = CharField(unique=True)
     introduction = CharField(default="")
 
+    @classmethod
+    def select_names(cls):
+        return cls.select(cls.id, cls.name).order_by(cls.name)
+
     def new():
         return User.create(name=f"NEW USER [{uuid4().hex[:8]}]")
 
@@ -33,5 +37,13 @@ class User(BaseModel):
             introduction=self.introduction,
         )
 
+    def delete_instance(self, *args, **kwargs):
+        """Delete the user, leaving its chats without a user."""
+
+        with db.atomic():
+            return super().delete_instance(
+                *args, recursive=True, delete_nullable=False, **kwargs
+            )
+
     def get_taken_names(self):
         return [user.name for user in User.select().where(User.name != self.name)]
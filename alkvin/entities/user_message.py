@@ -11,9 +11,11 @@ Example usage:
 import os
 from datetime import datetime
 
-from peewee import CharField, DateTimeField, ForeignKeyField
+from peewee import CharField, DateTimeField, ForeignKeyField, fn
 
-from alkvin.db import BaseModel
+from alkvin.db import BaseModel, JSONField
+
+from alkvin.audio.peaks import remove_peaks
 
 from alkvin.entities.chat import Chat
 
@@ -21,20 +23,64 @@ from alkvin.entities.chat import Chat
 class UserMessage(BaseModel):
     """UserMessage model class for chat user messages."""
 
-    chat = ForeignKeyField(Chat, backref="user_messages")
+    chat = ForeignKeyField(Chat, backref="user_messages", on_delete="CASCADE")
 
     audio_file = CharField()
     audio_created_at = DateTimeField(default=datetime.now)
 
+    recording_started_at = DateTimeField(null=True)
+    recording_stopped_at = DateTimeField(null=True)
+
+    # Speech segments of the audio as [start, end] times in seconds
+    speech_segments = JSONField(default=list)
+
     transcript = CharField(default="")
+    transcript_requested_at = DateTimeField(null=True)
     transcript_received_at = DateTimeField(null=True)
 
     sent_at = DateTimeField(null=True)
 
     @property
     def audio_path(self):
-        return os.path.join(self.chat.audio_dir, self.audio_file)
+        # The chat id is enough, no need to load the chat
+        return os.path.join(Chat.get_audio_dir(self.chat_id), self.audio_file)
+
+    @property
+    def context_entry(self):
+        """Key, API format and time of the message in the conversation
+        context."""
+
+        return (
+            ("user", self.id),
+            {"role": "user", "content": self.transcript},
+            self.sent_at,
+        )
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+
+        if self.sent_at is not None:
+            Chat.update_context(self.chat_id, *self.context_entry)
+        else:
+            Chat.remove_from_context(self.chat_id, ("user", self.id))
+
+    def delete_instance(self, *args, **kwargs):
+        Chat.remove_from_context(self.chat_id, ("user", self.id))
 
-    def delete_instance(self):
         if os.path.exists(self.audio_path):
             os.remove(self.audio_path)
+
+        remove_peaks(self.audio_path)
+
+        return super().delete_instance(*args, **kwargs)
+
+
+# Ordering of the chat messages, see `Chat.select_timeline`
+UserMessage.add_index(
+    UserMessage.index(
+        UserMessage.chat,
+        UserMessage.sent_at.is_null(False),
+        fn.COALESCE(UserMessage.sent_at, UserMessage.audio_created_at),
+        name="user_message_timeline",
+    )
+)
@@ -0,0 +1,60 @@
+"""
+Janitor
+=======
+
+This module defines the Janitor class, which removes files of deleted
+entities (e.g. the audio directory of a deleted chat) in a background
+thread, so deleting a big chat doesn't freeze the UI.
+
+The jobs run one by one, in the order they're submitted. Files are expected
+to be moved out of the way (e.g. renamed) before their removal is submitted,
+so a new entity can't get confused with a deleted one in the meantime. Files
+left behind when the application exits before the janitor is done are
+expected to be removed at the next start.
+
+Example usage:
+    janitor = get_janitor()
+    os.rename(chat_audio_dir, deleted_chat_audio_dir)
+    janitor.remove_tree(deleted_chat_audio_dir)
+"""
+
+import queue
+import shutil
+import threading
+
+from kivy.logger import Logger
+
+
+def get_janitor():
+    """Return the janitor singleton."""
+    if not hasattr(get_janitor, "janitor"):
+        get_janitor.janitor = Janitor()
+
+    return get_janitor.janitor
+
+
+class Janitor:
+    """Background removal of files of deleted entities."""
+
+    def __init__(self):
+        self._jobs = queue.Queue()
+
+        self._thread = threading.Thread(target=self._run, name="janitor", daemon=True)
+        self._thread.start()
+
+    def submit(self, func, *args):
+        """Run the function with the arguments in the janitor thread."""
+
+        self._jobs.put((func, args))
+
+    def remove_tree(self, path):
+        self.submit(shutil.rmtree, path, True)  # ignore_errors
+
+    def _run(self):
+        while True:
+            func, args = self._jobs.get()
+
+            try:
+                func(*args)
+            except Exception as e:
+                Logger.error(f"Janitor: {e}")
@@ -26,13 +26,16 @@ from alkvin.uix.screens.bot_create_screen import BotCreateScreen
 from alkvin.uix.screens.bot_replicate_screen import BotReplicateScreen
 from alkvin.uix.screens.settings_screen import SettingsScreen
 
-from alkvin.db import db
+from alkvin.db import db, migrate_tables
 
 from alkvin.entities.chat import Chat
 from alkvin.entities.user import User
 from alkvin.entities.bot import Bot
 from alkvin.entities.user_message import UserMessage
 from alkvin.entities.assistant_message import AssistantMessage
+from alkvin.entities.cached_completion import CachedCompletion
+from alkvin.entities.cached_transcript import CachedTranscript
+from alkvin.entities.speech_blob import SpeechBlob
 
 
 class AppRoot(ScreenManager):
@@ -110,8 +113,30 @@ class MainApp(MDApp):
         return AppRoot()
 
     def on_start(self):
+        models = [
+            Chat,
+            User,
+            Bot,
+            UserMessage,
+            AssistantMessage,
+            CachedCompletion,
+            CachedTranscript,
+            SpeechBlob,
+        ]
+
         db.connect()
-        db.create_tables([Chat, User, Bot, UserMessage, AssistantMessage])
+        db.create_tables(models)
+
+        # Rows of user messages of deleted chats left by older versions, which
+        # didn't delete them (before the migrations, which would fail on them)
+        UserMessage.delete().where(
+            UserMessage.chat.not_in(Chat.select(Chat.id))
+        ).execute()
+
+        migrate_tables(models)
+
+        SpeechBlob.remove_unreferenced_files()
+        Chat.remove_deleted_audio_dirs()
 
         if get_key(".env", "OPENAI_API_KEY") is None:
             Clock.schedule_once(
@@ -0,0 +1,27 @@
+from .completion import CompletionService
+from .speech import SpeechService
+from .transcription import TranscriptionService
+
+
+def get_completion_service():
+    """Return the completion service singleton."""
+    if not hasattr(get_completion_service, "completion_service"):
+        get_completion_service.completion_service = CompletionService()
+
+    return get_completion_service.completion_service
+
+
+def get_speech_service():
+    """Return the speech service singleton."""
+    if not hasattr(get_speech_service, "speech_service"):
+        get_speech_service.speech_service = SpeechService()
+
+    return get_speech_service.speech_service
+
+
+def get_transcription_service():
+    """Return the transcription service singleton."""
+    if not hasattr(get_transcription_service, "transcription_service"):
+        get_transcription_service.transcription_service = TranscriptionService()
+
+    return get_transcription_service.transcription_service
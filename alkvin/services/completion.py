@@ -0,0 +1,202 @@
+"""
+Completion Service
+==================
+
+This module defines the CompletionService class, which streams chat
+completions from a worker thread to the UI.
+
+The completion deltas (tokens) received by the worker are collected and
+handed over to the UI at most once per frame, so a fast stream doesn't
+flood the UI with label updates.
+
+Completions of bots with the completion cache enabled (see
+`Bot.caches_completions`) are looked up in the persistent cache of
+completions first and handed over as a single delta when found; the cache
+hits and misses are counted over the session.
+
+The service also folds the oldest conversation messages, before they stop
+fitting into the token budget of the context, into the rolling summary of
+the chat (see `Chat.pack_context`), in the background after a turn.
+
+Example usage:
+    completion_service = CompletionService()
+    completion_service.complete(
+        bot,
+        chat.messages_to_complete,
+        on_delta=lambda text: print(text, end=""),
+        on_completed=lambda completion, error: print(),
+    )
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from kivy.clock import Clock, mainthread
+from kivy.logger import Logger
+
+from alkvin.config import COMPLETION_WORKERS
+from alkvin.entities.cached_completion import CachedCompletion
+
+
+class CompletionStream:
+    """Completion deltas buffered between the worker and the UI thread."""
+
+    def __init__(self, on_delta, on_completed):
+        self._on_delta = on_delta
+        self._on_completed = on_completed
+
+        self._lock = threading.Lock()
+        self._deltas = []
+        self._completion = []
+        self._done = False
+        self._error = None
+        self._cancelled = False
+
+        self._flush_event = Clock.schedule_interval(self._flush, 0)
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    def cancel(self):
+        """Stop the stream; no more callbacks are called."""
+
+        self._cancelled = True
+        self._flush_event.cancel()
+
+    def put(self, delta):
+        with self._lock:
+            self._deltas.append(delta)
+
+    def close(self, error=None):
+        with self._lock:
+            self._done = True
+            self._error = error
+
+    def _flush(self, dt):
+        with self._lock:
+            deltas, self._deltas = self._deltas, []
+            done, error = self._done, self._error
+
+        if deltas:
+            text = "".join(deltas)
+            self._completion.append(text)
+            self._on_delta(text)
+
+        if done:
+            self._flush_event.cancel()
+
+            if error is not None:
+                Logger.error(f"CompletionService: {error}")
+            self._on_completed("".join(self._completion), error)
+
+            return False
+
+
+class CompletionService:
+    """Streaming chat completions."""
+
+    def __init__(self, max_workers=COMPLETION_WORKERS):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="completion"
+        )
+
+        self._summarizing_chat_ids = set()
+
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def complete(self, bot, messages, on_delta, on_completed):
+        """Stream the bot's completion of the messages.
+
+        The `on_delta(text)` callback receives new text of the completion and
+        the `on_completed(completion, error)` callback the whole completion,
+        both on the main (UI) thread.
+        """
+
+        completion_stream = CompletionStream(on_delta, on_completed)
+        self._executor.submit(self._stream, bot, messages, completion_stream)
+
+        return completion_stream
+
+    def summarize_context(self, chat):
+        """Fold the oldest messages of the chat's context into its rolling
+        summary, if they take too much of the token budget."""
+
+        if chat.id in self._summarizing_chat_ids:
+            return
+
+        _, messages_to_summarize, summarized_until = chat.pack_context()
+        if not messages_to_summarize:
+            return
+
+        self._summarizing_chat_ids.add(chat.id)
+
+        future = self._executor.submit(
+            chat.bot.summarize_messages, chat.context_summary, messages_to_summarize
+        )
+        future.add_done_callback(
+            mainthread(
+                lambda future: self._on_context_summarized(
+                    chat, summarized_until, future
+                )
+            )
+        )
+
+    def _on_context_summarized(self, chat, summarized_until, future):
+        self._summarizing_chat_ids.discard(chat.id)
+
+        error = future.exception()
+        if error is not None:
+            Logger.error(f"CompletionService: {error}")
+            return
+
+        chat.set_context_summary(future.result(), summarized_until)
+
+    def _count_cache_lookup(self, is_hit):
+        with self._cache_lock:
+            if is_hit:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+
+            Logger.info(
+                f"CompletionService: Cache {'hit' if is_hit else 'miss'} "
+                f"({self.cache_hits} hits, {self.cache_misses} misses)"
+            )
+
+    def _stream(self, bot, messages, completion_stream):
+        cache_key = None
+        deltas = []
+        try:
+            if bot.caches_completions:
+                cache_key = CachedCompletion.get_key(
+                    messages, bot.completion_temperature
+                )
+
+                completion = CachedCompletion.lookup(cache_key)
+                self._count_cache_lookup(completion is not None)
+
+                if completion is not None:
+                    completion_stream.put(completion)
+                    completion_stream.close()
+                    return
+
+            for delta in bot.stream_completion(messages):
+                if completion_stream.cancelled:
+                    break
+
+                completion_stream.put(delta)
+                deltas.append(delta)
+        except Exception as e:
+            completion_stream.close(e)
+            return
+
+        completion_stream.close()
+
+        if cache_key is not None and not completion_stream.cancelled:
+            try:
+                CachedCompletion.store(cache_key, "".join(deltas))
+            except Exception as e:
+                Logger.error(f"CompletionService: {e}")
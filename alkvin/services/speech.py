@@ -0,0 +1,357 @@
+"""
+Speech Service
+==============
+
+This module defines the SpeechService class, which synthesizes speech of
+assistant messages in a bounded pool of worker threads.
+
+A text, or a text stream such as a streamed completion, is split into
+sentences by the SentenceSplitter class and every sentence is synthesized
+by a separate request into its own segment, so several segments are
+synthesized concurrently and the first one can be played while the rest of
+the text is still being generated. The segments are played gaplessly, in
+order, from a PCM stream queue, starting right after the first audio chunk
+arrives.
+
+The segments are kept as raw PCM in memory only. When all of them are
+synthesized, they're stored as a single speech file for replaying, with
+the waveform peaks computed along the way, in the compact format of the
+speech store (see `SPEECH_STORE_PROFILE`); the message keeps the index of
+its segments (texts and durations), not their audio.
+
+The speech files are kept in the speech store (see `SpeechBlob`), so texts
+synthesized before with the same voice are stored only once. The pipeline
+pins the speech file while it uses it, so it can't be removed from the store
+by a deletion of another message meanwhile. Files of failed or cancelled
+syntheses are removed when they're no longer used.
+
+Example usage:
+    speech_service = SpeechService()
+    speech_pipeline = speech_service.start(
+        bot,
+        on_first_chunk=lambda pcm_stream: audio_bus.play_stream(widget, pcm_stream),
+        on_synthesized=lambda speech_file, segments, error: print(speech_file),
+    )
+    speech_pipeline.add_text("Hello there. ")
+    speech_pipeline.add_text("How are you?")
+    speech_pipeline.close()
+"""
+
+import os
+import re
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from uuid import uuid4
+
+import numpy as np
+
+from kivy.clock import mainthread
+from kivy.logger import Logger
+
+from alkvin.audio.encoder import StreamingEncoder
+from alkvin.audio.peaks import PeaksAccumulator, save_peaks
+from alkvin.audio.stream_player import PCMStream, PCMStreamQueue
+from alkvin.config import SPEECH_SEGMENT_MIN_LENGTH, SPEECH_WORKERS
+from alkvin.entities.bot import SPEECH_FRAME_RATE
+from alkvin.entities.speech_blob import SPEECH_STORE_PROFILE, SpeechBlob
+
+
+# End of a sentence followed by a whitespace, optionally after closing quotes
+# or brackets
+_SENTENCE_END = re.compile(r"(?<=[.!?…])[\"'”’)\]]*\s+")
+
+
+class SentenceSplitter:
+    """Incremental splitting of a text stream into sentences.
+
+    Sentences shorter than `min_length` characters are joined with the
+    following ones, so the speech isn't synthesized in too many requests.
+    """
+
+    def __init__(self, min_length=SPEECH_SEGMENT_MIN_LENGTH):
+        self._min_length = min_length
+        self._text = ""
+
+    def feed(self, text):
+        """Add text of the stream and return the completed sentences."""
+
+        self._text += text
+
+        sentences = []
+        start = 0
+        for match in _SENTENCE_END.finditer(self._text):
+            sentence = self._text[start : match.end()].strip()
+            if len(sentence) >= self._min_length:
+                sentences.append(sentence)
+                start = match.end()
+
+        self._text = self._text[start:]
+
+        return sentences
+
+    def flush(self):
+        """Return the rest of the stream as the last sentence."""
+
+        sentence, self._text = self._text.strip(), ""
+
+        return [sentence] if sentence else []
+
+
+def split_sentences(text, min_length=SPEECH_SEGMENT_MIN_LENGTH):
+    sentence_splitter = SentenceSplitter(min_length)
+
+    return sentence_splitter.feed(text) + sentence_splitter.flush()
+
+
+def _open_speech_file(speech_path):
+    return StreamingEncoder(speech_path, SPEECH_STORE_PROFILE)
+
+
+def _finish_speech_file(speech_file, partial_path, speech_path=None):
+    """Finish encoding of the speech file written to the partial path and
+    move it to the speech path, or discard it if no speech path is given."""
+
+    speech_file.close()
+    try:
+        speech_file.wait()
+    except Exception:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        if speech_path is not None:
+            raise
+        return
+
+    if speech_path is not None:
+        os.replace(partial_path, speech_path)
+    elif os.path.exists(partial_path):
+        os.remove(partial_path)
+
+
+def _get_partial_path(speech_path):
+    """Return a unique path the speech file is written to before it's complete."""
+
+    return f"{speech_path}.{uuid4().hex[:8]}.part"
+
+
+def _synthesize_segment(bot, text, pcm_stream, on_first_chunk, is_cancelled):
+    """Synthesize the text into the PCM stream.
+
+    Returns the PCM chunks of the segment and its peaks.
+    """
+
+    pcm_chunks = []
+    peaks_accumulator = PeaksAccumulator(SPEECH_FRAME_RATE)
+
+    try:
+        for pcm_chunk in bot.stream_speech(text):
+            if is_cancelled():
+                raise CancelledError()
+
+            pcm_stream.write(pcm_chunk)
+            if not pcm_chunks:
+                on_first_chunk()
+
+            pcm_chunks.append(pcm_chunk)
+            peaks_accumulator.add(pcm_chunk)
+    finally:
+        pcm_stream.close()
+
+    return pcm_chunks, peaks_accumulator.peaks
+
+
+def _store_speech(segment_pcm_chunks, segment_peaks, speech_path):
+    """Encode the segments into the speech file, unless it's stored already."""
+
+    if os.path.exists(speech_path):
+        return  # Already in the speech store
+
+    partial_path = _get_partial_path(speech_path)
+    speech_file = _open_speech_file(partial_path)
+    try:
+        for pcm_chunks in segment_pcm_chunks:
+            for pcm_chunk in pcm_chunks:
+                speech_file.write(pcm_chunk)
+    except BaseException:
+        _finish_speech_file(speech_file, partial_path)
+        raise
+
+    save_peaks(speech_path, np.concatenate([np.empty((0, 2))] + segment_peaks))
+    _finish_speech_file(speech_file, partial_path, speech_path)
+
+
+class SpeechPipeline:
+    """Sentence by sentence speech synthesis of a (streamed) text.
+
+    All the methods are meant to be called on the main (UI) thread.
+    """
+
+    def __init__(self, executor, bot, on_first_chunk, on_synthesized):
+        self._executor = executor
+        self._bot = bot
+        self._on_first_chunk = on_first_chunk
+        self._on_synthesized = on_synthesized
+
+        self.pcm_stream = PCMStreamQueue(SPEECH_FRAME_RATE)
+
+        self._sentence_splitter = SentenceSplitter()
+        self._segments = []  # {"text": sentence}
+        self._futures = []
+        self._pinned_files = []  # Files used until the synthesis ends
+        self._first_chunk_received = False
+        self._closed = False
+        self._cancelled = False
+        self._done = False
+
+    def add_text(self, text):
+        for sentence in self._sentence_splitter.feed(text):
+            self._add_segment(sentence)
+
+    def close(self):
+        """Mark the end of the text."""
+
+        if self._closed:
+            return
+
+        for sentence in self._sentence_splitter.flush():
+            self._add_segment(sentence)
+
+        self._closed = True
+        self.pcm_stream.close()
+
+        self._on_segment_done()
+
+    def cancel(self):
+        """Stop the synthesis and drop the segments synthesized so far."""
+
+        self._cancelled = True
+        for future in self._futures:
+            future.cancel()
+
+        if self._closed:
+            self._on_segment_done()
+        else:
+            self.close()
+
+    def _add_segment(self, sentence):
+        if self._closed or self._cancelled:
+            return
+
+        segment_pcm_stream = PCMStream(SPEECH_FRAME_RATE)
+        self.pcm_stream.append(segment_pcm_stream)
+
+        future = self._executor.submit(
+            _synthesize_segment,
+            self._bot,
+            sentence,
+            segment_pcm_stream,
+            self._notify_first_chunk,
+            lambda: self._cancelled,
+        )
+        future.add_done_callback(mainthread(lambda future: self._on_segment_done()))
+
+        self._segments.append({"text": sentence})
+        self._futures.append(future)
+
+    def _pin(self, speech_file):
+        SpeechBlob.pin(speech_file)
+        self._pinned_files.append(speech_file)
+
+    def _finish(self, speech_file, segments, error):
+        """Hand the result over and unpin the files (a message keeps them by
+        its references, see `AssistantMessage.set_speech`)."""
+
+        try:
+            self._on_synthesized(speech_file, segments, error)
+        finally:
+            pinned_files, self._pinned_files = self._pinned_files, []
+            SpeechBlob.unpin(*pinned_files)
+
+    @mainthread
+    def _notify_first_chunk(self):
+        if self._first_chunk_received or self._cancelled:
+            return
+
+        self._first_chunk_received = True
+        self._on_first_chunk(self.pcm_stream)
+
+    def _on_segment_done(self):
+        if (
+            self._done
+            or not self._closed
+            or not all(future.done() for future in self._futures)
+        ):
+            return
+
+        self._done = True
+
+        errors = [
+            CancelledError() if future.cancelled() else future.exception()
+            for future in self._futures
+        ]
+        error = next((error for error in errors if error is not None), None)
+
+        if error is not None:
+            if not isinstance(error, CancelledError):
+                Logger.error(f"SpeechService: {error}")
+
+            self._finish(None, [], error)
+            return
+
+        segment_pcm_chunks = [future.result()[0] for future in self._futures]
+        for segment, pcm_chunks in zip(self._segments, segment_pcm_chunks):
+            frame_count = sum(map(len, pcm_chunks)) // PCMStream.SAMPLE_WIDTH
+            segment["duration"] = round(frame_count / SPEECH_FRAME_RATE, 3)
+
+        speech_file = SpeechBlob.get_file(
+            " ".join(segment["text"] for segment in self._segments),
+            self._bot.speech_voice,
+        )
+        self._pin(speech_file)
+        future = self._executor.submit(
+            _store_speech,
+            segment_pcm_chunks,
+            [future.result()[1] for future in self._futures],
+            SpeechBlob.get_path(speech_file),
+        )
+        future.add_done_callback(
+            mainthread(lambda future: self._on_stored(speech_file, future))
+        )
+
+    def _on_stored(self, speech_file, future):
+        error = future.exception()
+        if error is not None:
+            Logger.error(f"SpeechService: {error}")
+            self._finish(None, [], error)
+            return
+
+        self._finish(speech_file, self._segments, None)
+
+
+class SpeechService:
+    """Pipelined speech synthesis."""
+
+    def __init__(self, max_workers=SPEECH_WORKERS):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="speech"
+        )
+
+    def start(self, bot, on_first_chunk, on_synthesized):
+        """Start synthesis of a text stream into the speech store.
+
+        The `on_first_chunk(pcm_stream)` callback receives the (playable)
+        stream of the speech audio as soon as its first chunk is synthesized.
+        The `on_synthesized(speech_file, segments, error)` callback receives
+        the name of the stored speech file and the index of its segments
+        once it's complete. Both callbacks are called on the main (UI)
+        thread.
+        """
+
+        return SpeechPipeline(self._executor, bot, on_first_chunk, on_synthesized)
+
+    def synthesize(self, bot, text, on_first_chunk, on_synthesized):
+        """Synthesize speech of the whole text, see `start`."""
+
+        speech_pipeline = self.start(bot, on_first_chunk, on_synthesized)
+        speech_pipeline.add_text(text)
+        speech_pipeline.close()
+
+        return speech_pipeline
@@ -0,0 +1,289 @@
+"""
+Transcription Service
+=====================
+
+This module defines the TranscriptionService class, which transcribes audio
+of user messages in a bounded pool of worker threads, so the speech-to-text
+requests never block the UI.
+
+Requests for the same audio and transcription settings share a single
+in-flight request, e.g. when the transcription button is tapped repeatedly.
+
+Transcripts of the whole audio are cached in the database by the hash of
+the audio content and of the transcription settings, so the same audio is
+transcribed only once.
+
+Recordings can be transcribed speculatively, while they're still being
+recorded: windows of the speech cut at its pauses are transcribed as soon
+as they're recorded and merged into a running partial transcript of the
+recording. The transcription of the message with the recorded audio then
+only waits for the last window. The merged transcripts aren't cached, so
+a bad merge is fixed by transcribing the message again.
+
+Example usage:
+    transcription_service = TranscriptionService()
+    transcription_service.transcribe(
+        message, bot, lambda transcript, error: print(transcript)
+    )
+
+    # While recording
+    transcription_service.transcribe_window(recording_path, speech_window, bot)
+    # After the recording is moved to the message audio path
+    transcription_service.move_partial_transcript(recording_path, audio_path)
+"""
+
+import os
+import re
+import tempfile
+import wave
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from kivy.clock import mainthread
+from kivy.logger import Logger
+
+from alkvin.config import RECORDINGS_DIR, TRANSCRIPTION_WORKERS
+
+from alkvin.entities.cached_transcript import CachedTranscript
+
+
+def _get_request_key(user_message, bot):
+    return (
+        user_message.audio_path,
+        bot.transcription_language,
+        bot.transcription_prompt,
+        bot.transcription_temperature,
+    )
+
+
+def _get_cache_key(audio_path, bot):
+    return CachedTranscript.get_key(
+        audio_path,
+        bot.transcription_language,
+        bot.transcription_prompt,
+        bot.transcription_temperature,
+    )
+
+
+def _transcribe_cached(audio_path, bot):
+    cache_key = _get_cache_key(audio_path, bot)
+
+    transcript = CachedTranscript.lookup(cache_key)
+    if transcript is None:
+        transcript = bot.transcribe_audio(audio_path)
+        CachedTranscript.store(cache_key, transcript)
+
+    return transcript
+
+
+def _normalize_word(word):
+    return re.sub(r"\W", "", word.lower())
+
+
+def merge_transcripts(transcript, window_transcript, max_skipped_words=2):
+    """Append the transcript of the next (overlapping) window to the transcript.
+
+    The longest run of words ending the transcript, which is repeated at the
+    start of the window transcript, is dropped from the window transcript.
+    A few leading words of the window transcript may be skipped, since the
+    first word of a window is often cut.
+    """
+
+    words = transcript.split()
+    window_words = window_transcript.split()
+
+    normalized_words = [_normalize_word(word) for word in words]
+    normalized_window_words = [_normalize_word(word) for word in window_words]
+
+    merge_start = 0
+    max_overlap = 0
+    for skipped_words in range(min(max_skipped_words, len(window_words)) + 1):
+        for overlap in range(
+            min(len(words), len(window_words) - skipped_words), max_overlap, -1
+        ):
+            if (
+                normalized_words[-overlap:]
+                == normalized_window_words[skipped_words : skipped_words + overlap]
+            ):
+                merge_start = skipped_words + overlap
+                max_overlap = overlap
+                break
+
+    return " ".join(words + window_words[merge_start:])
+
+
+class PartialTranscript:
+    """Running transcript of a recording merged from transcripts of its
+    windows; the future gets the whole transcript after the last window."""
+
+    def __init__(self):
+        self.text = ""
+        self.future = Future()
+
+        self._window_transcripts = {}  # window_index: transcript
+        self._merged_window_count = 0
+        self._window_count = None  # Known after the last window
+        self._error = None
+
+    def add_window_transcript(self, speech_window, transcript, error=None):
+        if speech_window.is_last:
+            self._window_count = speech_window.index + 1
+        if error is not None:
+            self._error = error
+
+        self._window_transcripts[speech_window.index] = transcript or ""
+        while self._merged_window_count in self._window_transcripts:
+            self.text = merge_transcripts(
+                self.text,
+                self._window_transcripts.pop(self._merged_window_count),
+            )
+            self._merged_window_count += 1
+
+        if self._merged_window_count == self._window_count:
+            if self._error is not None:
+                self.future.set_exception(self._error)
+            else:
+                self.future.set_result(self.text)
+
+
+class TranscriptionService:
+    """Asynchronous transcription of user messages."""
+
+    def __init__(self, max_workers=TRANSCRIPTION_WORKERS):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="transcription"
+        )
+        self._in_flight = {}  # request_key: future
+        self._partial_transcripts = {}  # audio_path: partial_transcript
+
+    def is_pending(self, user_message, bot):
+        return (
+            _get_request_key(user_message, bot) in self._in_flight
+            or user_message.audio_path in self._partial_transcripts
+        )
+
+    def transcribe(self, user_message, bot, on_transcribed=None):
+        """Transcribe the user message audio with the bot's settings.
+
+        Returns a future of the transcript. The `on_transcribed(transcript,
+        error)` callback is called on the main (UI) thread.
+        """
+
+        request_key = _get_request_key(user_message, bot)
+
+        future = self._in_flight.get(request_key)
+        if future is None:
+            future = self._submit(user_message.audio_path, bot)
+            self._in_flight[request_key] = future
+
+            future.add_done_callback(
+                lambda future: self._on_request_done(request_key, future)
+            )
+
+        if on_transcribed is not None:
+            future.add_done_callback(
+                lambda future: self._notify(on_transcribed, future)
+            )
+
+        return future
+
+    def _submit(self, audio_path, bot):
+        partial_transcript = self._partial_transcripts.pop(audio_path, None)
+        if partial_transcript is None:
+            return self._executor.submit(_transcribe_cached, audio_path, bot)
+
+        # Fall back to the transcription of the whole audio if the speculative
+        # transcription failed
+        future = Future()
+
+        def on_partial_transcript_done(partial_future):
+            if partial_future.exception() is None:
+                future.set_result(partial_future.result())
+                return
+
+            Logger.warning(
+                f"TranscriptionService: Partial transcription failed: "
+                f"{partial_future.exception()}"
+            )
+            fallback_future = self._executor.submit(_transcribe_cached, audio_path, bot)
+            fallback_future.add_done_callback(
+                lambda fallback_future: (
+                    future.set_exception(fallback_future.exception())
+                    if fallback_future.exception() is not None
+                    else future.set_result(fallback_future.result())
+                )
+            )
+
+        partial_transcript.future.add_done_callback(on_partial_transcript_done)
+
+        return future
+
+    def transcribe_window(self, recording_path, speech_window, bot):
+        """Transcribe a window of the speech while the recording continues."""
+
+        partial_transcript = self._partial_transcripts.get(recording_path)
+        if partial_transcript is None:
+            if speech_window.index != 0:
+                return  # The previous windows haven't been transcribed
+
+            partial_transcript = PartialTranscript()
+            self._partial_transcripts[recording_path] = partial_transcript
+
+        if speech_window.pcm_data:
+            future = self._executor.submit(
+                self._transcribe_window, speech_window, bot
+            )
+        else:
+            future = Future()
+            future.set_result("")
+
+        future.add_done_callback(
+            lambda future: self._on_window_transcribed(
+                partial_transcript, speech_window, future
+            )
+        )
+
+    def _transcribe_window(self, speech_window, bot):
+        with tempfile.NamedTemporaryFile(
+            suffix=".wav", dir=RECORDINGS_DIR, delete=False
+        ) as window_file:
+            with wave.open(window_file, "wb") as window_wave:
+                window_wave.setnchannels(speech_window.channels)
+                window_wave.setsampwidth(2)
+                window_wave.setframerate(speech_window.frame_rate)
+                window_wave.writeframes(speech_window.pcm_data)
+
+        try:
+            return bot.transcribe_audio(window_file.name)
+        finally:
+            os.remove(window_file.name)
+
+    @mainthread
+    def _on_window_transcribed(self, partial_transcript, speech_window, future):
+        error = future.exception()
+        partial_transcript.add_window_transcript(
+            speech_window, None if error is not None else future.result(), error
+        )
+
+    def move_partial_transcript(self, recording_path, audio_path):
+        """Move the partial transcript along with its recording file."""
+
+        partial_transcript = self._partial_transcripts.pop(recording_path, None)
+        if partial_transcript is not None:
+            self._partial_transcripts[audio_path] = partial_transcript
+
+    def discard_partial_transcript(self, recording_path):
+        """Discard the partial transcript of a dropped recording."""
+
+        self._partial_transcripts.pop(recording_path, None)
+
+    @mainthread
+    def _on_request_done(self, request_key, future):
+        self._in_flight.pop(request_key, None)
+
+        if future.exception() is not None:
+            Logger.error(f"TranscriptionService: {future.exception()}")
+
+    @mainthread
+    def _notify(self, on_transcribed, future):
+        error = future.exception()
+        on_transcribed(None if error is not None else future.result(), error)
@@ -0,0 +1,323 @@
+"""
+Turn Pipeline
+=============
+
+This module defines the TurnPipeline class, which runs a single turn of
+a voice conversation - transcription of the user message, its sending,
+completion of the reply, speech synthesis of the reply and its playback -
+as asynchronous stages.
+
+Every stage starts as soon as its input is ready, so the stages overlap:
+the reply is spoken sentence by sentence while it's still being generated
+and its playback starts with the first synthesized audio chunk.
+
+The pipeline records the time of every stage on the messages, so latencies
+of the turn, e.g. the voice-to-voice latency from the end of the user's
+recording to the start of the reply's playback, can be measured.
+
+After the reply is completed, messages pushed out of the token budget of
+the chat context are summarized in the background, off the turn's critical
+path.
+
+Example usage:
+    turn_pipeline = TurnPipeline(chat, user_message, speak=True)
+    turn_pipeline.bind(
+        on_reply_delta=lambda turn_pipeline, message, text: print(text),
+        on_finished=lambda turn_pipeline, error: print("done"),
+    )
+    turn_pipeline.start()
+"""
+
+from concurrent.futures import CancelledError
+from datetime import datetime
+
+from kivy.event import EventDispatcher
+from kivy.logger import Logger
+
+from alkvin.audio import get_audio_bus
+from alkvin.services import (
+    get_completion_service,
+    get_speech_service,
+    get_transcription_service,
+)
+
+from alkvin.entities.assistant_message import AssistantMessage
+
+
+class TurnPipeline(EventDispatcher):
+    """Asynchronous stages of a turn of a voice conversation.
+
+    The pipeline starts with the first stage the user message needs: it's
+    transcribed if it has no transcript, and sent if it isn't sent yet. Without
+    a user message, only the chat is completed. The reply is spoken only if
+    `speak` is set, and it's played by the `speech_player` audio player widget
+    (e.g. set in an `on_reply_started` handler).
+
+    Events (all dispatched on the main thread):
+        on_transcribed(user_message, error)
+        on_sent(user_message)
+        on_reply_started(assistant_message)
+        on_reply_delta(assistant_message, text)
+        on_reply_completed(assistant_message, error)
+        on_speech_synthesized(assistant_message, error)
+        on_finished(error)
+    """
+
+    __events__ = (
+        "on_transcribed",
+        "on_sent",
+        "on_reply_started",
+        "on_reply_delta",
+        "on_reply_completed",
+        "on_speech_synthesized",
+        "on_finished",
+    )
+
+    def __init__(self, chat, user_message=None, speak=False, **kwargs):
+        super().__init__(**kwargs)
+
+        self.chat = chat
+        self.user_message = user_message
+        self.assistant_message = None
+        self.speak = speak
+
+        self.speech_player = None
+
+        self._completion_stream = None
+        self._speech_pipeline = None
+        self._is_playing = False
+        self._is_finished = False
+        self._started_at = None
+
+    @property
+    def is_finished(self):
+        return self._is_finished
+
+    def start(self):
+        self._started_at = datetime.now()
+
+        if self.user_message is None:
+            self._complete()
+        elif not self.user_message.transcript:
+            # Voice-to-voice latency is measured from the end of the recording
+            if self.user_message.recording_stopped_at is not None:
+                self._started_at = self.user_message.recording_stopped_at
+            self._transcribe()
+        elif self.user_message.sent_at is None:
+            self._send()
+        else:
+            self._complete()
+
+    def cancel(self):
+        """Stop all the running stages of the turn."""
+
+        if self._is_finished:
+            return
+
+        if self._completion_stream is not None:
+            self._completion_stream.cancel()
+        self._cancel_speech()
+        if self._is_playing:
+            get_audio_bus().stop(self.speech_player)
+
+        self._finish(CancelledError())
+
+    def _transcribe(self):
+        self.user_message.transcript_requested_at = datetime.now()
+
+        get_transcription_service().transcribe(
+            self.user_message, self.chat.bot, self._on_transcribed
+        )
+
+    def _on_transcribed(self, transcript, error):
+        user_message = self.user_message
+        # The transcription started automatically, so it doesn't replace
+        # a transcript the user requested meanwhile
+        if error is None and not user_message.transcript:
+            user_message.transcript = transcript
+            user_message.transcript_received_at = datetime.now()
+        user_message.save()
+
+        # The (paid for) transcript is kept even if the turn was cancelled,
+        # only the message isn't sent
+        if self._is_finished:
+            return
+
+        self.dispatch("on_transcribed", user_message, error)
+
+        if error is not None or not user_message.transcript:
+            self._finish(error)
+            return
+
+        self._send()
+
+    def _send(self):
+        self.user_message.sent_at = datetime.now()
+        self.user_message.save()
+
+        self.dispatch("on_sent", self.user_message)
+
+        self._complete()
+
+    def _complete(self):
+        bot = self.chat.bot
+        messages = self.chat.messages_to_complete
+
+        self.assistant_message = AssistantMessage(
+            chat=self.chat, completion_requested_at=datetime.now()
+        )
+        self.dispatch("on_reply_started", self.assistant_message)
+
+        if self.speak:
+            self.assistant_message.speech_requested_at = datetime.now()
+            self._speech_pipeline = get_speech_service().start(
+                bot,
+                on_first_chunk=self._on_first_speech_chunk,
+                on_synthesized=self._on_speech_synthesized,
+            )
+
+        self._completion_stream = get_completion_service().complete(
+            bot,
+            messages,
+            on_delta=self._on_reply_delta,
+            on_completed=self._on_reply_completed,
+        )
+
+    def _on_reply_delta(self, text):
+        if self.assistant_message.completion_first_token_at is None:
+            self.assistant_message.completion_first_token_at = datetime.now()
+
+        if self._speech_pipeline is not None:
+            self._speech_pipeline.add_text(text)
+
+        self.dispatch("on_reply_delta", self.assistant_message, text)
+
+    def _on_reply_completed(self, completion, error):
+        self._completion_stream = None
+
+        if error is not None:
+            self._cancel_speech()
+
+            self.dispatch("on_reply_completed", self.assistant_message, error)
+            self._finish(error)
+            return
+
+        self.assistant_message.completion = completion
+        self.assistant_message.completion_received_at = datetime.now()
+        self.assistant_message.save()
+
+        self.dispatch("on_reply_completed", self.assistant_message, None)
+
+        get_completion_service().summarize_context(self.chat)
+
+        if self._speech_pipeline is not None:
+            self._speech_pipeline.close()
+        else:
+            self._finish()
+
+    def _cancel_speech(self):
+        # Detached first, since a cancelled pipeline may report its end
+        # synchronously, and the callback ignores detached pipelines
+        speech_pipeline, self._speech_pipeline = self._speech_pipeline, None
+        if speech_pipeline is not None:
+            speech_pipeline.cancel()
+
+    def _on_first_speech_chunk(self, pcm_stream):
+        self.assistant_message.speech_first_chunk_at = datetime.now()
+
+        if self.speech_player is None:
+            return
+
+        audio_bus = get_audio_bus()
+        audio_bus.play_stream(self.speech_player, pcm_stream)
+
+        if self.speech_player.state == "playing":
+            self.assistant_message.playback_started_at = datetime.now()
+            self._is_playing = True
+            self.speech_player.bind(state=self._on_speech_player_state)
+
+    def _on_speech_player_state(self, speech_player, state):
+        if state != "stopped":
+            return
+
+        speech_player.unbind(state=self._on_speech_player_state)
+        self._is_playing = False
+
+        if self._speech_pipeline is None:
+            self._finish()
+
+    def _on_speech_synthesized(self, speech_file, segments, error):
+        if self._is_finished or self._speech_pipeline is None:
+            return
+
+        self._speech_pipeline = None
+
+        message = self.assistant_message
+        if error is None:
+            message.set_speech(speech_file, segments)
+            message.speech_received_at = datetime.now()
+        # A reply without a completion (e.g. failed) isn't persisted
+        if message.completion_received_at is not None:
+            message.save()
+
+        self.dispatch("on_speech_synthesized", message, error)
+
+        if error is not None or not self._is_playing:
+            self._finish(error)
+
+    def _finish(self, error=None):
+        if self._is_finished:
+            return
+
+        self._is_finished = True
+
+        if self._is_playing:
+            self.speech_player.unbind(state=self._on_speech_player_state)
+            self._is_playing = False
+
+        if error is None:
+            self._log_latencies()
+
+        self.dispatch("on_finished", error)
+
+    def _log_latencies(self):
+        """Log times of the stages since the start of the turn."""
+
+        stage_times = []
+        if self.user_message is not None:
+            stage_times.append(("transcript", self.user_message.transcript_received_at))
+        if self.assistant_message is not None:
+            stage_times += [
+                ("first token", self.assistant_message.completion_first_token_at),
+                ("completion", self.assistant_message.completion_received_at),
+                ("first speech chunk", self.assistant_message.speech_first_chunk_at),
+                ("playback", self.assistant_message.playback_started_at),
+            ]
+
+        latencies = ", ".join(
+            f"{stage} {(stage_time - self._started_at).total_seconds():.2f} s"
+            for stage, stage_time in stage_times
+            if stage_time is not None and stage_time >= self._started_at
+        )
+        Logger.info(f"TurnPipeline: Latencies: {latencies}")
+
+    def on_transcribed(self, user_message, error):
+        pass
+
+    def on_sent(self, user_message):
+        pass
+
+    def on_reply_started(self, assistant_message):
+        pass
+
+    def on_reply_delta(self, assistant_message, text):
+        pass
+
+    def on_reply_completed(self, assistant_message, error):
+        pass
+
+    def on_speech_synthesized(self, assistant_message, error):
+        pass
+
+    def on_finished(self, error):
+        pass
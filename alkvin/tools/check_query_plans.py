@@ -0,0 +1,181 @@
+"""
+Check Query Plans
+=================
+
+This module checks the query plans of the hot queries of the application
+against a synthetic database, so a changed query or a missing index doesn't
+silently turn them into full table scans or temporary B-tree sorts.
+
+The synthetic database is an in-memory database with the application schema
+(including all the declared indexes) filled with generated chats and
+messages, and analyzed, so the query planner has statistics like those of
+a real, long-used database.
+
+Example usage:
+    python -m alkvin.tools.check_query_plans
+"""
+
+import re
+import sys
+from datetime import datetime, timedelta
+
+from peewee import SqliteDatabase
+
+from alkvin.entities.chat import Chat
+from alkvin.entities.user import User
+from alkvin.entities.bot import Bot
+from alkvin.entities.user_message import UserMessage
+from alkvin.entities.assistant_message import AssistantMessage
+from alkvin.entities.cached_completion import CachedCompletion
+from alkvin.entities.cached_transcript import CachedTranscript
+from alkvin.entities.speech_blob import SpeechBlob
+
+
+MODELS = [
+    Chat,
+    User,
+    Bot,
+    UserMessage,
+    AssistantMessage,
+    CachedCompletion,
+    CachedTranscript,
+    SpeechBlob,
+]
+
+# Plan steps reading a whole table without an index ("SCAN TABLE t1" in
+# SQLite before 3.36) or sorting the rows
+_FULL_SCAN = re.compile(r"^SCAN (TABLE )?\S+$")
+_TEMP_B_TREE = re.compile(r"USE TEMP B-TREE")
+
+
+def fill_synthetic_data(chat_count=100, messages_per_chat=100):
+    now = datetime.now()
+
+    User.insert_many([{"name": f"User {i}"} for i in range(20)]).execute()
+    Bot.insert_many([{"name": f"Bot {i}"} for i in range(20)]).execute()
+
+    Chat.insert_many(
+        [
+            {
+                "title": f"Chat {i}",
+                "user": i % 20 + 1,
+                "bot": i % 20 + 1,
+                "updated_at": now - timedelta(hours=i),
+            }
+            for i in range(chat_count)
+        ]
+    ).execute()
+
+    for chat_id in range(1, chat_count + 1):
+        started_at = now - timedelta(days=chat_id)
+
+        UserMessage.insert_many(
+            [
+                {
+                    "chat": chat_id,
+                    "audio_file": f"user_{i}.opus",
+                    "audio_created_at": started_at + timedelta(minutes=2 * i),
+                    "transcript": f"Message {i}",
+                    # The latest few messages are unsent
+                    "sent_at": (
+                        started_at + timedelta(minutes=2 * i, seconds=30)
+                        if i < messages_per_chat - 3
+                        else None
+                    ),
+                }
+                for i in range(messages_per_chat)
+            ]
+        ).execute()
+        AssistantMessage.insert_many(
+            [
+                {
+                    "chat": chat_id,
+                    "completion": f"Reply {i}",
+                    "completion_received_at": started_at
+                    + timedelta(minutes=2 * i + 1),
+                }
+                for i in range(messages_per_chat - 3)
+            ]
+        ).execute()
+
+
+def get_hot_queries():
+    """Return the hot queries of the application by their names."""
+
+    chat = Chat.get_by_id(1)
+
+    return {
+        "recent chats": Chat.select_recent(),
+        "chat with participants": Chat.select_with_participants(chat.id),
+        "chat timeline": chat.select_timeline(),
+        "chat timeline page": chat.select_timeline(limit=20, offset=40),
+        "user messages by ids": UserMessage.select().where(
+            UserMessage.id.in_([1, 2, 3])
+        ),
+        "assistant messages by ids": AssistantMessage.select().where(
+            AssistantMessage.id.in_([1, 2, 3])
+        ),
+        "chat user messages": chat.user_messages,
+        "chat assistant messages": chat.assistant_messages,
+        "bot names": Bot.select_names(),
+        "user names": User.select_names(),
+        "cached completion": CachedCompletion.select().where(
+            CachedCompletion.key == "0" * 64
+        ),
+        "cached transcript": CachedTranscript.select().where(
+            CachedTranscript.key == "0" * 64
+        ),
+        "speech blob": SpeechBlob.select().where(SpeechBlob.file == "0.wav"),
+    }
+
+
+def get_query_plan(database, query):
+    sql, params = query.sql()
+
+    return [
+        row[-1] for row in database.execute_sql(f"EXPLAIN QUERY PLAN {sql}", params)
+    ]
+
+
+def check_query_plans():
+    """Return the problematic steps of the query plans by query names."""
+
+    database = SqliteDatabase(":memory:")
+
+    with database.bind_ctx(MODELS):
+        database.create_tables(MODELS)
+        fill_synthetic_data()
+        database.execute_sql("ANALYZE")
+
+        problems = {}
+        for name, query in get_hot_queries().items():
+            query_plan = get_query_plan(database, query)
+            print(f"{name}:")
+            for step in query_plan:
+                print(f"    {step}")
+
+            problems[name] = [
+                step
+                for step in query_plan
+                if _FULL_SCAN.match(step) or _TEMP_B_TREE.search(step)
+            ]
+
+    return {name: steps for name, steps in problems.items() if steps}
+
+
+def main():
+    problems = check_query_plans()
+
+    if problems:
+        print()
+        for name, steps in problems.items():
+            print(f"FAIL {name}: {'; '.join(steps)}")
+
+        sys.exit(1)
+
+    print()
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
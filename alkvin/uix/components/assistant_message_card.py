@@ -9,13 +9,16 @@ Example usage:
     card = AssistantMessageCard(message: AssistantMessage)
 """
 
-import os
+from datetime import datetime
 
 from kivy.lang import Builder
-from kivy.properties import ObjectProperty, StringProperty
+from kivy.properties import BooleanProperty, ObjectProperty, StringProperty
 
 from kivymd.uix.card import MDCard
 
+from alkvin.audio import get_audio_bus
+from alkvin.services import get_speech_service
+
 
 Builder.load_string(
     """
@@ -38,9 +41,19 @@ Builder.load_string(
 
     MDBoxLayout:
         size_hint_y: None
-        height: 0 if root.assistant_speech_path is not None else self.minimum_height
-        opacity: 0 if root.assistant_speech_path is not None else 1
-        disabled: root.assistant_speech_path is not None
+        height: 
+            (0 
+            if root.assistant_speech_path is not None or root.is_completing 
+            or root.is_synthesizing 
+            else self.minimum_height)
+        opacity: 
+            (0 
+            if root.assistant_speech_path is not None or root.is_completing 
+            or root.is_synthesizing 
+            else 1)
+        disabled: 
+            (root.assistant_speech_path is not None or root.is_completing 
+            or root.is_synthesizing)
         
         MDIconButton:
             icon: "account-voice"
@@ -49,12 +62,19 @@ Builder.load_string(
             on_release: root.synthesize_speech()
 
     AudioPlayerBox:
+        id: audio_player_box
         audio_path: root.assistant_speech_path if root.assistant_speech_path else ""
         progress_bar_color: app.theme_cls.primary_color
 
-        height: "48dp" if root.assistant_speech_path is not None else 0
-        opacity: 1 if root.assistant_speech_path is not None else 0
-        disabled: root.assistant_speech_path is None       
+        height: 
+            ("48dp" 
+            if root.assistant_speech_path is not None or root.is_synthesizing 
+            else 0)
+        opacity: 
+            (1 
+            if root.assistant_speech_path is not None or root.is_synthesizing 
+            else 0)
+        disabled: root.assistant_speech_path is None and not root.is_synthesizing
 """
 )
 
@@ -68,6 +88,12 @@ class AssistantMessageCard(MDCard):
     assistant_completion = StringProperty()
     assistant_speech_path = StringProperty(allownone=True)
 
+    # The completion is being streamed into the card
+    is_completing = BooleanProperty(False)
+
+    # The speech is being synthesized (and played while streamed)
+    is_synthesizing = BooleanProperty(False)
+
     def __init__(self, message, chat, **kwargs):
         super().__init__(**kwargs)
         self.message = message
@@ -78,12 +104,48 @@ class AssistantMessageCard(MDCard):
 
         self.assistant_completion = message.completion
         self.assistant_speech_path = message.speech_path
+        self.is_completing = False
+        self.is_synthesizing = False
 
-    def synthesize_speech(self):
-        speech_file = self.chat.bot.synthesize_speech(self.message.completion)
-        self.assistant_speech_path = os.path.join(self.chat.audio_dir, speech_file)
-
-        # TODO: Move generated speech file to chat audio directory
+    def append_completion(self, text):
+        self.assistant_completion += text
 
-        self.message.speech_file = speech_file
-        self.message.save()
+    def synthesize_speech(self):
+        """Synthesize speech of the completion and play it while it's streamed."""
+
+        message = self.message
+        message.speech_requested_at = datetime.now()
+
+        self.is_synthesizing = True
+        get_speech_service().synthesize(
+            self.chat.bot,
+            message.completion,
+            on_first_chunk=lambda pcm_stream: self._on_first_speech_chunk(
+                message, pcm_stream
+            ),
+            on_synthesized=lambda speech_file, segments, error: (
+                self._on_speech_synthesized(message, speech_file, segments, error)
+            ),
+        )
+
+    def _on_first_speech_chunk(self, message, pcm_stream):
+        message.speech_first_chunk_at = datetime.now()
+
+        if message is not self.message or not self.is_synthesizing:
+            return
+
+        audio_player_box = self.ids.audio_player_box
+        get_audio_bus().play_stream(audio_player_box, pcm_stream)
+
+        if audio_player_box.state == "playing":
+            message.playback_started_at = datetime.now()
+
+    def _on_speech_synthesized(self, message, speech_file, segments, error):
+        if error is None:
+            message.set_speech(speech_file, segments)
+            message.speech_received_at = datetime.now()
+            message.save()
+
+        if message is self.message:  # The widget may have been recycled
+            self.is_synthesizing = False
+            self.assistant_speech_path = message.speech_path
@@ -6,7 +6,6 @@ This model defines the AudioPlayerBox class, which is a custom box layout
 widget used for playing audio files.
 """
 
-from kivy.clock import Clock
 from kivy.lang import Builder
 from kivy.properties import ListProperty, StringProperty
 
@@ -17,6 +16,9 @@ from alkvin.audio import get_audio_bus
 
 Builder.load_string(
     """
+#:import WaveformView alkvin.uix.components.waveform_view.WaveformView
+
+
 <AudioPlayerBox>:
     orientation: "horizontal"
     size_hint_y: None
@@ -38,12 +40,10 @@ Builder.load_string(
         on_release: root.toggle_playing()
 
     MDBoxLayout:
-        padding: dp(10), dp(20), dp(30), dp(20)
-        MDProgressBar:
-            id: progress_bar
-            min: 0.1
-            max: 100
-            value: .1
+        padding: dp(10), dp(10), dp(30), dp(10)
+        WaveformView:
+            id: waveform_view
+            audio_path: root.audio_path
             color: root.progress_bar_color
 """
 )
@@ -61,34 +61,27 @@ class AudioPlayerBox(MDBoxLayout):
         super().__init__(**kwargs)
 
         self.audio_bus = get_audio_bus()
-        self.progress_bar_update_schedule = None
-
-    def _update_progress_bar(self, dt):
-
-        progress = (
-            self.ids.progress_bar.max
-            if self.audio_bus.audio_total_time == 0
-            else (self.audio_bus.audio_passed_time / self.audio_bus.audio_total_time)
-        )
 
-        self.ids.progress_bar.value = progress * (
-            self.ids.progress_bar.max - self.ids.progress_bar.min
+    def _update_progress_bar(self, audio_bus, passed_time, total_time):
+        self.ids.waveform_view.progress = (
+            1 if total_time == 0 else min(passed_time / total_time, 1)
         )
 
     def on_state(self, instance, value):
         if value == "playing":
             self.ids.play_button.icon = "stop"
-            self.progress_bar_update_schedule = Clock.schedule_interval(
-                self._update_progress_bar, 0.2
-            )
+            self.audio_bus.bind(on_progress=self._update_progress_bar)
         elif value == "stopped":
             self.ids.play_button.icon = "play"
-            self.progress_bar_update_schedule.cancel()
-            self.progress_bar_update_schedule = None
-            self.ids.progress_bar.value = self.ids.progress_bar.min
+            self.audio_bus.unbind(on_progress=self._update_progress_bar)
+            self.ids.waveform_view.progress = 0
 
     def toggle_playing(self):
-        if self.state == "stopped" and self.audio_bus.state != "recording":
+        if (
+            self.state == "stopped"
+            and self.audio_path
+            and self.audio_bus.state != "recording"
+        ):
             self.audio_bus.play(self, self.audio_path)
         elif self.state == "playing":
             self.audio_bus.stop(self)
@@ -9,14 +9,19 @@ widget used for recording audio.
 import os
 from uuid import uuid4
 
-from kivy.clock import Clock
 from kivy.lang import Builder
-from kivy.properties import StringProperty
+from kivy.properties import (
+    BooleanProperty,
+    ListProperty,
+    ObjectProperty,
+    StringProperty,
+)
 
 from kivymd.uix.boxlayout import MDBoxLayout
 from kivymd.uix.behaviors import CommonElevationBehavior
 
 from alkvin.audio import get_audio_bus
+from alkvin.audio.profiles import DEFAULT_RECORDING_PROFILE, get_recording_profile
 
 from alkvin.config import RECORDINGS_DIR
 
@@ -47,6 +52,20 @@ Builder.load_string(
             
             on_release: root.state = "stopped" if root.state == "recording" else "recording"
 
+    MDAnchorLayout:
+        anchor_x: "center"
+        anchor_y: "center"
+
+        MDIconButton:
+            icon: "headset" if root.hands_free else "headset-off"
+            theme_icon_color: "Custom"
+            icon_color: 
+                (app.theme_cls.colors["LightGreen"]["A400"] 
+                if root.hands_free 
+                else app.theme_cls.colors["Gray"]["300"])
+
+            on_release: root.hands_free = not root.hands_free
+
     MDAnchorLayout:
         anchor_x: "right"
         anchor_y: "center"
@@ -76,34 +95,57 @@ class AudioRecorderBox(MDBoxLayout, CommonElevationBehavior):
     state = StringProperty("stopped")
 
     recording_path = StringProperty(allownone=True)
+    recording_profile = StringProperty(DEFAULT_RECORDING_PROFILE)
+    speech_segments = ListProperty()
+    recording_started_at = ObjectProperty(allownone=True)
+    recording_stopped_at = ObjectProperty(allownone=True)
+
+    # Hands-free conversation mode, see `AudioBus.hands_free`
+    hands_free = BooleanProperty(False)
+
+    # Dispatched with the recording path when a recording starts, and with
+    # the recording path and the error when a recording is dropped (e.g. no
+    # speech was detected in it)
+    __events__ = ("on_recording_started", "on_recording_dropped")
 
     def __init__(self, **kwargs):
         super(AudioRecorderBox, self).__init__(**kwargs)
         self._audio_bus = get_audio_bus()
-        self._timer = None
 
-    def _update_timer(self, dt):
-        if self.state == "stopped":
-            self._timer.cancel()
-            return
+    def on_recording_started(self, recording_path):
+        pass
 
-        t = int(self._audio_bus.audio_passed_time)
+    def on_recording_dropped(self, recording_path, error):
+        pass
+
+    def _update_timer(self, audio_bus, passed_time, total_time):
+        t = int(passed_time)
         t_mins = t // 60
         t_secs = t % 60
         self.ids.audio_recorder_timer.text = f"{t_mins:02}:{t_secs:02}"
 
+    def on_hands_free(self, instance, value):
+        self._audio_bus.hands_free = value
+
+        if value and self.state == "stopped":
+            self.state = "recording"
+
     def on_state(self, instance, value):
         if value == "recording":
             self.recording_path = None
 
             os.makedirs(RECORDINGS_DIR, exist_ok=True)
-            recording_path = os.path.join(RECORDINGS_DIR, f"user_{uuid4().hex[:8]}.mp3")
-            self._audio_bus.record(self, recording_path)
+            recording_extension = get_recording_profile(self.recording_profile).extension
+            recording_path = os.path.join(
+                RECORDINGS_DIR, f"user_{uuid4().hex[:8]}.{recording_extension}"
+            )
+            self._audio_bus.record(self, recording_path, self.recording_profile)
+            self.dispatch("on_recording_started", recording_path)
 
-            self._timer = Clock.schedule_interval(self._update_timer, 0.5)
+            self._audio_bus.bind(on_progress=self._update_timer)
 
         elif value == "stopped":
-            self._timer.cancel()
+            self._audio_bus.unbind(on_progress=self._update_timer)
             self.ids.audio_recorder_timer.text = "00:00"
 
             self._audio_bus.stop(self)
@@ -104,7 +104,7 @@ class SelectBotDialog(MDDialog):
         if Bot.select().count() == 0:
             Bot.create(name="Dummy Bot")
 
-        bots = Bot.select(Bot.id, Bot.name).order_by(Bot.name)
+        bots = Bot.select_names()
         bot_ids = [bot.id for bot in bots]
         self.selected_bot_id = chat_bot_id if chat_bot_id in bot_ids else bot_ids[0]
 
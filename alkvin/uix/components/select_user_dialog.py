@@ -90,7 +90,7 @@ class SelectUserDialog(MDDialog):
         if User.select().count() == 0:
             User.create(name="Dummy User")
 
-        users = User.select(User.id, User.name).order_by(User.name)
+        users = User.select_names()
         user_ids = [user.id for user in users]
         self.selected_user_id = (
             chat_user_id if chat_user_id in user_ids else user_ids[0]
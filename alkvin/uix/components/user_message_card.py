@@ -16,6 +16,8 @@ from kivy.properties import BooleanProperty, ObjectProperty, StringProperty
 
 from kivymd.uix.card import MDCard
 
+from alkvin.services import get_transcription_service
+
 
 Builder.load_string(
     """
@@ -49,9 +51,18 @@ Builder.load_string(
             MDIconButton:
                 icon: "typewriter"
                 icon_size: "24dp"
+                opacity: 0 if root.is_transcribing else 1
+                disabled: root.is_transcribing
 
                 on_release: root.transcribe_audio()
 
+            MDSpinner:
+                size_hint: None, None
+                size: "24dp", "24dp"
+                pos_hint: {"center_y": .5}
+                active: root.is_transcribing
+                opacity: 1 if root.is_transcribing else 0
+
         MDBoxLayout:
             size_hint_y: None
             height: self.minimum_height if root.user_transcript else 0
@@ -103,6 +114,7 @@ class UserMessageCard(MDCard):
     user_transcript = StringProperty()
 
     is_message_sent = BooleanProperty(False)
+    is_transcribing = BooleanProperty(False)
 
     def __init__(self, message, chat, **kwargs):
         super().__init__(**kwargs)
@@ -117,11 +129,43 @@ class UserMessageCard(MDCard):
 
         self.is_message_sent = message.sent_at is not None
 
-    def transcribe_audio(self):
-        self.message.transcript = self.chat.bot.transcribe_audio(self.user_audio_path)
-        self.message.save()
-
-        self.user_transcript = self.message.transcript
+        self.is_transcribing = (
+            self.chat is not None
+            and self.chat.bot is not None
+            and get_transcription_service().is_pending(message, self.chat.bot)
+        )
+
+    def transcribe_audio(self, overwrite=True):
+        """Request the transcription of the message audio in the background.
+
+        The transcript replaces the current one, unless `overwrite` is False,
+        e.g. when finishing a speculative transcription, which may be beaten by
+        another transcription of the message.
+        """
+
+        message = self.message
+        message.transcript_requested_at = datetime.now()
+        self.is_transcribing = True
+
+        get_transcription_service().transcribe(
+            message,
+            self.chat.bot,
+            lambda transcript, error: self._on_transcribed(
+                message, transcript, error, overwrite
+            ),
+        )
+
+    def _on_transcribed(self, message, transcript, error, overwrite):
+        if error is None and (overwrite or not message.transcript):
+            message.transcript = transcript
+            message.transcript_received_at = datetime.now()
+            message.save()
+
+        if message is not self.message:
+            return  # The widget has been recycled meanwhile
+
+        self.is_transcribing = False
+        self.user_transcript = message.transcript
 
     def send_message(self):
         if not self.user_transcript:
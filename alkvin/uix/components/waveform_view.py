@@ -0,0 +1,208 @@
+"""
+Waveform View
+=============
+
+This module defines the WaveformView class, which is a custom widget drawing
+the waveform of an audio file from its precomputed peaks together with
+the playback progress.
+
+The peaks are loaded lazily, once the widget scrolls into the view. If an
+audio file has no peaks sidecar yet, the peaks are computed in a background
+thread. Until the peaks are available, a flat line is drawn.
+
+Example usage:
+    waveform_view = WaveformView(audio_path="message.opus")
+    waveform_view.progress = 0.5
+"""
+
+import threading
+
+import numpy as np
+
+from kivy.clock import mainthread
+from kivy.graphics import Color, Mesh
+from kivy.logger import Logger
+from kivy.metrics import dp
+from kivy.properties import ListProperty, NumericProperty, StringProperty
+from kivy.uix.scrollview import ScrollView
+from kivy.uix.widget import Widget
+
+from alkvin.audio.peaks import compute_file_peaks, load_peaks
+
+
+class WaveformView(Widget):
+    """Custom widget drawing the waveform of an audio file."""
+
+    audio_path = StringProperty()
+    progress = NumericProperty(0)  # 0.0 - 1.0
+    color = ListProperty([0.2, 0.2, 0.2, 1])
+
+    bar_width = NumericProperty(dp(2))
+    bar_spacing = NumericProperty(dp(1))
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+        self._peaks = None
+        self._loading_audio_path = None
+        self._scroll_view = None
+
+        with self.canvas:
+            self._played_color = Color()
+            self._played_mesh = Mesh(mode="triangles")
+            self._unplayed_color = Color()
+            self._unplayed_mesh = Mesh(mode="triangles")
+
+        self.bind(
+            pos=self._on_geometry,
+            size=self._on_geometry,
+            progress=self._redraw,
+            color=self._redraw,
+        )
+
+    def on_audio_path(self, instance, value):
+        self._peaks = None
+        self._redraw()
+        self._load_peaks_if_visible()
+
+    def _on_geometry(self, *args):
+        self._load_peaks_if_visible()
+        self._redraw()
+
+    def _find_scroll_view(self):
+        parent = self.parent
+        while parent is not None and not isinstance(parent, ScrollView):
+            parent = parent.parent
+
+        return parent
+
+    def _is_visible(self):
+        if self.parent is None or self.width <= 0:
+            return False
+
+        scroll_view = self._find_scroll_view()
+        if scroll_view is not self._scroll_view:
+            if self._scroll_view is not None:
+                self._scroll_view.unbind(scroll_y=self._load_peaks_if_visible)
+            if scroll_view is not None:
+                scroll_view.bind(scroll_y=self._load_peaks_if_visible)
+            self._scroll_view = scroll_view
+
+        if scroll_view is None:
+            return True
+
+        y = self.to_window(*self.pos)[1]
+        scroll_view_y = scroll_view.to_window(*scroll_view.pos)[1]
+
+        return scroll_view_y - self.height <= y <= scroll_view_y + scroll_view.height
+
+    def _load_peaks_if_visible(self, *args):
+        if (
+            self._peaks is not None
+            or not self.audio_path
+            or self._loading_audio_path == self.audio_path
+            or not self._is_visible()
+        ):
+            return
+
+        peaks = load_peaks(self.audio_path)
+        if peaks is not None:
+            self._set_peaks(self.audio_path, peaks)
+            return
+
+        self._loading_audio_path = self.audio_path
+        threading.Thread(
+            target=self._compute_peaks, args=(self.audio_path,), daemon=True
+        ).start()
+
+    def _compute_peaks(self, audio_path):
+        try:
+            peaks = compute_file_peaks(audio_path)
+        except Exception as e:
+            Logger.warning(f"WaveformView: Peaks of {audio_path} not computed: {e}")
+            return
+
+        self._set_peaks(audio_path, peaks)
+
+    @mainthread
+    def _set_peaks(self, audio_path, peaks):
+        if audio_path != self.audio_path:
+            return  # The widget has been recycled meanwhile
+
+        self._peaks = peaks
+        self._redraw()
+
+    def _redraw(self, *args):
+        bar_count = max(1, int(self.width // (self.bar_width + self.bar_spacing)))
+
+        if self._peaks is None or len(self._peaks) == 0:
+            bar_mins = np.full(bar_count, -1.0)
+            bar_maxs = np.full(bar_count, 1.0)
+        else:
+            bar_count = min(bar_count, len(self._peaks))
+            bar_starts = np.linspace(0, len(self._peaks), bar_count, endpoint=False)
+            bar_starts = bar_starts.astype(int)
+            bar_mins = np.minimum.reduceat(self._peaks[:, 0], bar_starts).astype(float)
+            bar_maxs = np.maximum.reduceat(self._peaks[:, 1], bar_starts).astype(float)
+
+        # Bars are scaled to the half of the widget height, at least 1 px
+        half_height = max(self.height / 2, 1)
+        min_extent = 1 / half_height
+        bar_bottoms = (
+            self.center_y + np.minimum(bar_mins / 128, -min_extent) * half_height
+        )
+        bar_tops = self.center_y + np.maximum(bar_maxs / 128, min_extent) * half_height
+        bar_lefts = self.x + np.arange(bar_count) * (self.width / bar_count)
+        bar_rights = bar_lefts + self.bar_width
+
+        played_bar_count = int(round(self.progress * bar_count))
+
+        self._played_color.rgba = self.color
+        self._unplayed_color.rgba = self.color[:3] + [self.color[3] * 0.35]
+
+        self._played_mesh.vertices, self._played_mesh.indices = self._bars_mesh(
+            bar_lefts[:played_bar_count],
+            bar_rights[:played_bar_count],
+            bar_bottoms[:played_bar_count],
+            bar_tops[:played_bar_count],
+        )
+        self._unplayed_mesh.vertices, self._unplayed_mesh.indices = self._bars_mesh(
+            bar_lefts[played_bar_count:],
+            bar_rights[played_bar_count:],
+            bar_bottoms[played_bar_count:],
+            bar_tops[played_bar_count:],
+        )
+
+    @staticmethod
+    def _bars_mesh(lefts, rights, bottoms, tops):
+        """Return mesh vertices and indices of rectangles of the bars."""
+
+        bar_count = len(lefts)
+        zeros = np.zeros(bar_count)
+
+        # Four vertices (x, y, u, v) per bar: bottom-left, bottom-right,
+        # top-right, top-left
+        vertices = np.stack(
+            [
+                np.stack([lefts, bottoms, zeros, zeros], axis=1),
+                np.stack([rights, bottoms, zeros, zeros], axis=1),
+                np.stack([rights, tops, zeros, zeros], axis=1),
+                np.stack([lefts, tops, zeros, zeros], axis=1),
+            ],
+            axis=1,
+        )
+
+        first_vertices = np.arange(bar_count) * 4
+        indices = np.stack(
+            [
+                first_vertices,
+                first_vertices + 1,
+                first_vertices + 2,
+                first_vertices,
+                first_vertices + 2,
+                first_vertices + 3,
+            ],
+            axis=1,
+        )
+
+        return vertices.ravel().tolist(), indices.ravel().tolist()
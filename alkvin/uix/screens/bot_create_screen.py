@@ -12,7 +12,12 @@ lacking the ability to replicate the newly created bot.
 """
 
 from kivy.lang import Builder
-from kivy.properties import NumericProperty, ObjectProperty, StringProperty
+from kivy.properties import (
+    BooleanProperty,
+    NumericProperty,
+    ObjectProperty,
+    StringProperty,
+)
 
 from kivymd.uix.menu import MDDropdownMenu
 from kivymd.uix.screen import MDScreen
@@ -25,6 +30,9 @@ from alkvin.entities.bot import Bot
 
 Builder.load_string(
     """
+#:import config alkvin.config
+
+
 <BotCreateScreen>:
     MDBoxLayout:
         orientation: "vertical"
@@ -94,6 +102,29 @@ Builder.load_string(
                     hint_text: "Text generation temperature"
                     helper_text: "Must be a decimal number between 0.0 and 2.0"
 
+                MDBoxLayout:
+                    adaptive_height: True
+                    spacing: "10dp"
+
+                    MDCheckbox:
+                        id: bot_completion_cache_checkbox
+                        size_hint: None, None
+                        size: "48dp", "48dp"
+                        active: root.bot_completion_cache_enabled
+                        on_active: root.bot_completion_cache_enabled = self.active
+
+                    MDLabel:
+                        text:
+                            "Reuse text generations at temperatures up to {}".format(
+                            config.COMPLETION_CACHE_MAX_TEMPERATURE)
+
+                MDTextField:
+                    id: bot_context_token_budget_field
+                    text: root.bot_context_token_budget
+                    on_text: root.validate_context_token_budget(self)
+                    hint_text: "Context token budget"
+                    helper_text: "Must be a positive whole number"
+
                 MDTextField:
                     id: bot_summarization_prompt_field
                     text: root.bot_summarization_prompt
@@ -106,6 +137,13 @@ Builder.load_string(
                     text: root.bot_speech_voice
                     hint_text: "Text-to-speech voice"
                     on_focus: if self.focus: root.speech_voice_menu.open()
+
+                MDTextField:
+                    id: bot_recording_profile_field
+                    text: root.bot_recording_profile
+                    hint_text: "Recording profile"
+                    helper_text: "Capture and storage format of voice messages"
+                    on_focus: if self.focus: root.recording_profile_menu.open()
 """
 )
 
@@ -122,8 +160,11 @@ class BotCreateScreen(MDScreen):
     bot_transcription_temperature = StringProperty()
     bot_completion_prompt = StringProperty()
     bot_completion_temperature = StringProperty()
+    bot_completion_cache_enabled = BooleanProperty(False)
+    bot_context_token_budget = StringProperty()
     bot_summarization_prompt = StringProperty()
     bot_speech_voice = StringProperty()
+    bot_recording_profile = StringProperty()
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -144,6 +185,20 @@ class BotCreateScreen(MDScreen):
             ],
         )
 
+        recording_profiles = Bot.get_recording_profiles()
+        self.recording_profile_menu = MDDropdownMenu(
+            caller=self.ids.bot_recording_profile_field,
+            position="center",
+            items=[
+                {
+                    "viewclass": "OneLineListItem",
+                    "text": profile.capitalize(),
+                    "on_release": lambda x=profile: self.set_recording_profile(x),
+                }
+                for profile in recording_profiles
+            ],
+        )
+
         self.delete_bot_dialog = DeleteBotDialog()
 
     def validate_transcription_temperature(self, transcription_temperature_field):
@@ -166,6 +221,16 @@ class BotCreateScreen(MDScreen):
         else:
             completion_temperature_field.error = not (0.0 <= temperature <= 2.0)
 
+    def validate_context_token_budget(self, context_token_budget_field):
+        self.bot_context_token_budget = context_token_budget_field.text
+
+        try:
+            context_token_budget = int(self.bot_context_token_budget)
+        except ValueError:
+            context_token_budget_field.error = True
+        else:
+            context_token_budget_field.error = context_token_budget <= 0
+
     def on_bot_speech_voice(self, instance, value):
         self.ids.bot_speech_voice_field.text = value
 
@@ -173,6 +238,13 @@ class BotCreateScreen(MDScreen):
         self.bot_speech_voice = voice
         self.speech_voice_menu.dismiss()
 
+    def on_bot_recording_profile(self, instance, value):
+        self.ids.bot_recording_profile_field.text = value
+
+    def set_recording_profile(self, profile):
+        self.bot_recording_profile = profile
+        self.recording_profile_menu.dismiss()
+
     def on_pre_enter(self):
         self.bot = Bot.get_by_id(self.bot_id)
 
@@ -182,8 +254,11 @@ class BotCreateScreen(MDScreen):
         self.bot_transcription_temperature = str(self.bot.transcription_temperature)
         self.bot_completion_prompt = self.bot.completion_prompt
         self.bot_completion_temperature = str(self.bot.completion_temperature)
+        self.bot_completion_cache_enabled = self.bot.completion_cache_enabled
+        self.bot_context_token_budget = str(self.bot.context_token_budget)
         self.bot_summarization_prompt = self.bot.summarization_prompt
         self.bot_speech_voice = self.bot.speech_voice
+        self.bot_recording_profile = self.bot.recording_profile
 
         self.taken_bot_names = self.bot.get_taken_names()
 
@@ -224,10 +299,22 @@ class BotCreateScreen(MDScreen):
                     "Text generation temperature must be between 0.0 and 2.0"
                 )
 
+        self.bot.completion_cache_enabled = self.bot_completion_cache_enabled
+
+        try:
+            self.bot.context_token_budget = int(self.bot_context_token_budget)
+        except ValueError:
+            raise ValueError("Context token budget must be a whole number")
+        else:
+            if self.bot.context_token_budget <= 0:
+                raise ValueError("Context token budget must be positive")
+
         self.bot.summarization_prompt = self.bot_summarization_prompt
 
         self.bot.speech_voice = self.bot_speech_voice
 
+        self.bot.recording_profile = self.bot_recording_profile
+
         self.bot.save()
 
     def has_valid_data(self):
@@ -34,6 +34,14 @@ from alkvin.uix.components.user_message_card import UserMessageCard
 
 from alkvin.uix.tools.recycling import get_recycling_bin
 
+from alkvin.audio import get_audio_bus
+from alkvin.audio.peaks import move_peaks, remove_peaks
+
+from alkvin.services import get_transcription_service
+from alkvin.services.turn_pipeline import TurnPipeline
+
+from alkvin.config import SOUND_PREFETCH_COUNT
+
 from alkvin.entities.bot import Bot
 from alkvin.entities.chat import Chat
 from alkvin.entities.user import User
@@ -140,6 +148,12 @@ class ChatScreen(MDScreen):
         super().__init__(**kwargs)
         self.recycling_bin = get_recycling_bin()
 
+        self.turn_pipelines = []  # Running turns of the chat
+
+        # Chats of the recordings by recording path, captured when they start,
+        # since another chat may be open when their encoding finishes
+        self._recording_chat_ids = {}
+
         self.invalid_data_error_snackbar = InvalidDataErrorSnackbar()
         self.select_user_dialog = SelectUserDialog(self.on_user_selected)
 
@@ -161,26 +175,106 @@ class ChatScreen(MDScreen):
         )
 
         self.audio_recorder_box = AudioRecorderBox(pos_hint={"y": 0})
-        self.audio_recorder_box.bind(recording_path=self.create_user_message)
+        self.audio_recorder_box.bind(
+            recording_path=self.create_user_message,
+            on_recording_started=self.on_recording_started,
+            on_recording_dropped=self.on_recording_dropped,
+        )
+        get_audio_bus().bind(on_speech_window=self.on_speech_window)
         self.ids.chat_screen_audio_recorder_container.add_widget(
             self.audio_recorder_box
         )
 
+    def on_recording_started(self, audio_recorder_box, recording_path):
+        self._recording_chat_ids[recording_path] = self.chat.id
+
     def create_user_message(self, audio_recorder_box, audio_recording_path):
         if audio_recording_path is None:
             return
 
-        new_audio_file_name = f"user_{datetime.now().strftime('%Y%m%d%H%M%S')}.mp3"
-        new_audio_file_path = os.path.join(self.chat.audio_dir, new_audio_file_name)
+        chat_id = self._recording_chat_ids.pop(audio_recording_path, None)
+        if chat_id is None or not Chat.select().where(Chat.id == chat_id).exists():
+            # The chat was deleted while the recording was being finished
+            self.discard_recording(audio_recording_path)
+            return
+
+        audio_extension = os.path.splitext(audio_recording_path)[1]
+        new_audio_file_name = (
+            f"user_{datetime.now().strftime('%Y%m%d%H%M%S')}{audio_extension}"
+        )
+        new_audio_file_path = os.path.join(
+            Chat.get_audio_dir(chat_id), new_audio_file_name
+        )
         shutil.move(audio_recording_path, new_audio_file_path)
+        move_peaks(audio_recording_path, new_audio_file_path)
+        get_transcription_service().move_partial_transcript(
+            audio_recording_path, new_audio_file_path
+        )
 
-        message = UserMessage.create(chat=self.chat, audio_file=new_audio_file_name)
+        message = UserMessage.create(
+            chat=chat_id,
+            audio_file=new_audio_file_name,
+            speech_segments=audio_recorder_box.speech_segments,
+            recording_started_at=audio_recorder_box.recording_started_at,
+            recording_stopped_at=audio_recorder_box.recording_stopped_at,
+        )
+
+        if self.chat is None or chat_id != self.chat.id:
+            return  # Another chat was opened meanwhile
+        message.chat = self.chat
 
         message_widget = self.recycling_bin.get_message_widget(message, self.chat)
         message_widget.bind(is_message_sent=self.on_user_message_sent)
 
         self.ids.chat_screen_unsent_messages_container.add_widget(message_widget)
 
+        if self.audio_recorder_box.hands_free:
+            message_widget.is_transcribing = True
+            self.start_turn(message)
+        elif self.chat.bot is not None and get_transcription_service().is_pending(
+            message, self.chat.bot
+        ):
+            # Finish the transcription speculatively started while recording
+            message_widget.transcribe_audio(overwrite=False)
+
+    def discard_recording(self, recording_path):
+        if os.path.exists(recording_path):
+            os.remove(recording_path)
+        remove_peaks(recording_path)
+
+        get_transcription_service().discard_partial_transcript(recording_path)
+
+    def on_recording_dropped(self, audio_recorder_box, recording_path, error):
+        self._recording_chat_ids.pop(recording_path, None)
+        get_transcription_service().discard_partial_transcript(recording_path)
+
+        self.invalid_data_error_snackbar.text = str(error)
+        self.invalid_data_error_snackbar.open()
+
+        self.resume_listening()
+
+    def on_speech_window(self, audio_bus, recording_path, speech_window):
+        if self.chat is not None and self.chat.bot is not None:
+            get_transcription_service().transcribe_window(
+                recording_path, speech_window, self.chat.bot
+            )
+
+    def resume_listening(self):
+        """Start recording of the next message in the hands-free mode."""
+
+        if self.audio_recorder_box.hands_free:
+            self.audio_recorder_box.state = "recording"
+
+    def find_message_widget(self, message):
+        for message_widget in (
+            self.ids.chat_screen_sent_messages_container.children
+            + self.ids.chat_screen_unsent_messages_container.children
+        ):
+            if message_widget.message is message:
+                return message_widget
+
+        return None
+
     def select_user(self):
         if self.has_valid_data():
             self.select_user_dialog.open(self.chat.user_id)
@@ -200,7 +294,7 @@ class ChatScreen(MDScreen):
             if last_sent_message_widget is None or isinstance(
                 last_sent_message_widget, UserMessageCard
             ):
-                self.chat.bot.chat_complete(self.chat, self.on_chat_completed)
+                self.start_turn()
 
     def select_bot(self):
         if self.has_valid_data():
@@ -210,6 +304,8 @@ class ChatScreen(MDScreen):
         self.chat.bot = Bot.get(Bot.id == bot_id)
         self.chat.save()
 
+        self.audio_recorder_box.recording_profile = self.chat.bot.recording_profile
+
         last_sent_message_widget = (
             None
             if not self.ids.chat_screen_sent_messages_container.children
@@ -219,13 +315,86 @@ class ChatScreen(MDScreen):
         if last_sent_message_widget is None or isinstance(
             last_sent_message_widget, UserMessageCard
         ):
-            self.chat.bot.chat_complete(self.chat, self.on_chat_completed)
+            self.start_turn()
 
-    def on_chat_completed(self, completion):
-        message = AssistantMessage.create(chat=self.chat, completion=completion)
+    def start_turn(self, user_message=None):
+        """Run the turn of the user message (transcribe it, send it and get
+        the reply, spoken in the hands-free mode), or complete the chat."""
+
+        turn_pipeline = TurnPipeline(
+            self.chat, user_message, speak=self.audio_recorder_box.hands_free
+        )
+        turn_pipeline.bind(
+            on_transcribed=self.on_turn_transcribed,
+            on_sent=self.on_turn_sent,
+            on_reply_started=self.on_reply_started,
+            on_reply_delta=self.on_reply_delta,
+            on_reply_completed=self.on_reply_completed,
+            on_speech_synthesized=self.on_reply_spoken,
+            on_finished=self.on_turn_finished,
+        )
+        self.turn_pipelines.append(turn_pipeline)
+
+        turn_pipeline.start()
+
+    def on_turn_transcribed(self, turn_pipeline, message, error):
+        message_widget = self.find_message_widget(message)
+        if message_widget is not None:
+            message_widget.is_transcribing = False
+            message_widget.user_transcript = message.transcript
+
+    def on_turn_sent(self, turn_pipeline, message):
+        message_widget = self.find_message_widget(message)
+        if message_widget is not None:
+            message_widget.is_message_sent = True
+
+    def on_reply_started(self, turn_pipeline, message):
         message_widget = self.recycling_bin.get_message_widget(message, self.chat)
+        message_widget.is_completing = True
+        message_widget.is_synthesizing = turn_pipeline.speak
         self.ids.chat_screen_sent_messages_container.add_widget(message_widget)
 
+        turn_pipeline.speech_player = message_widget.ids.audio_player_box
+
+    def on_reply_delta(self, turn_pipeline, message, text):
+        message_widget = self.find_message_widget(message)
+        if message_widget is not None:
+            message_widget.append_completion(text)
+
+    def on_reply_completed(self, turn_pipeline, message, error):
+        message_widget = self.find_message_widget(message)
+        if message_widget is None:
+            return
+
+        if error is not None:
+            self.recycling_bin.recycle_message_widgets([message_widget])
+            return
+
+        message_widget.assistant_completion = message.completion
+        message_widget.is_completing = False
+
+    def on_reply_spoken(self, turn_pipeline, message, error):
+        message_widget = self.find_message_widget(message)
+        if message_widget is not None:
+            message_widget.is_synthesizing = False
+            message_widget.assistant_speech_path = message.speech_path
+
+    def on_turn_finished(self, turn_pipeline, error):
+        self.turn_pipelines.remove(turn_pipeline)
+
+        # Drop the reply of a cancelled turn
+        message = turn_pipeline.assistant_message
+        if message is not None and message.completion_received_at is None:
+            message_widget = self.find_message_widget(message)
+            if message_widget is not None:
+                self.recycling_bin.recycle_message_widgets([message_widget])
+
+        self.resume_listening()
+
+    def cancel_turns(self):
+        for turn_pipeline in list(self.turn_pipelines):
+            turn_pipeline.cancel()
+
     def on_user_message_sent(self, message_widget, is_message_sent):
         if not is_message_sent:
             return
@@ -233,7 +402,12 @@ class ChatScreen(MDScreen):
         self.ids.chat_screen_unsent_messages_container.remove_widget(message_widget)
         self.ids.chat_screen_sent_messages_container.add_widget(message_widget)
 
-        self.chat.bot.chat_complete(self.chat, self.on_chat_completed)
+        # Messages sent by a running turn are completed by it
+        if not any(
+            turn_pipeline.user_message is message_widget.message
+            for turn_pipeline in self.turn_pipelines
+        ):
+            self.start_turn(message_widget.message)
 
     def load_chat_messages(self):
         message_widgets = (
@@ -242,7 +416,9 @@ class ChatScreen(MDScreen):
         )
         self.recycling_bin.recycle_message_widgets(message_widgets)
 
-        for message in self.chat.messages:
+        messages = self.chat.messages
+
+        for message in messages:
             if isinstance(message, UserMessage):
                 message_widget = self.recycling_bin.get_message_widget(
                     message, self.chat
@@ -263,19 +439,44 @@ class ChatScreen(MDScreen):
 
         self.ids.chat_screen_scroll.scroll_y = 1
 
+        self.prefetch_audio(messages)
+
+    def prefetch_audio(self, messages):
+        """Preload audio of the latest user and assistant messages."""
+
+        user_audio_paths = [
+            message.audio_path
+            for message in messages
+            if isinstance(message, UserMessage)
+        ][-SOUND_PREFETCH_COUNT:]
+        assistant_speech_paths = [
+            message.speech_path
+            for message in messages
+            if isinstance(message, AssistantMessage) and message.speech_file
+        ][-SOUND_PREFETCH_COUNT:]
+
+        get_audio_bus().prefetch(
+            list(reversed(user_audio_paths + assistant_speech_paths))
+        )
+
     def on_pre_enter(self):
-        self.chat = Chat.get_by_id(self.chat_id)
+        self.chat = Chat.get_with_participants(self.chat_id)
 
         self.chat_title = self.chat.title
         self.chat_summary = self.chat.summary
 
         self.load_chat_messages()
 
+        get_audio_bus().partial_transcription = True
+
         last_sent_message_widget = (
             None
             if not self.ids.chat_screen_sent_messages_container.children
             else self.ids.chat_screen_sent_messages_container.children[0]
         )
+        if self.chat.bot is not None:
+            self.audio_recorder_box.recording_profile = self.chat.bot.recording_profile
+
         if self.chat.user is None:
             self.select_user_dialog.open(self.chat.user_id)
             # if both and user and bot are not selected, the select bot dialog will be opened after the the user is selected
@@ -284,7 +485,15 @@ class ChatScreen(MDScreen):
         elif last_sent_message_widget is None or isinstance(
             last_sent_message_widget, UserMessageCard
         ):
-            self.chat.bot.chat_complete(self.chat, self.on_chat_completed)
+            self.start_turn()
+
+    def on_pre_leave(self):
+        self.audio_recorder_box.hands_free = False
+        self.audio_recorder_box.state = "stopped"
+
+        get_audio_bus().partial_transcription = False
+
+        self.cancel_turns()
 
     def save_chat(self):
         self.chat_title = self.chat_title.strip()
@@ -332,6 +541,7 @@ class ChatScreen(MDScreen):
         self.ids.chat_screen_scroll.scroll_y = 1
 
     def delete_chat(self):
+        self.cancel_turns()
         self.chat.delete_instance()
 
         self.delete_chat_dialog.dismiss()
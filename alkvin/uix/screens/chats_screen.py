@@ -77,9 +77,7 @@ class ChatsScreen(MDScreen):
     chat_items = ListProperty()
 
     def on_pre_enter(self):
-        chats = Chat.select(Chat.id, Chat.title, Chat.summary).order_by(
-            Chat.updated_at.desc()
-        )
+        chats = Chat.select_recent()
         self.chat_items = [
             {
                 "chat_id": chat.id,
@@ -43,7 +43,8 @@ class RecyclingBin:
         elif isinstance(message, AssistantMessage):
             if self.assistant_message_widgets:
                 message_widget = self.assistant_message_widgets.pop()
-                message_widget.message_widget = message
+                message_widget.message = message
+                message_widget.chat = chat
             else:
                 message_widget = AssistantMessageCard(message, chat)
 